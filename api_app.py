@@ -1,10 +1,74 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from database import get_session as get_db, Vocabulary, User
+from typing import List, Optional
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import time
+import config
+import metrics
+from events import ChangeBroker, changed_users, format_event
+from word_cache import VocabularyCache
+from snapshot import BloomFilter, encode as encode_snapshot
+from vocab_io import FORMATS, ImportParser, aiter_export, import_rows
+from database import async_session_scope, get_async_db, get_async_engine, init_db, insert_ignore_vocabulary, bulk_insert_vocabulary, bulk_delete_vocabulary, get_vocabulary_version, get_vocabulary_changes, get_latest_change_id, query_vocabulary_page, query_search_vocabulary, query_user_stats, Vocabulary
 
-app = FastAPI()
+# Every endpoint is async and talks to the database through the async engine, so a slow query
+# waits on the event loop instead of holding one of the threadpool's workers.
+# Shared helpers from database.py are sync-style and run through AsyncSession.run_sync.
+
+broker = ChangeBroker()  # pushes vocabulary change events to /api/vocabulary/events subscribers
+word_cache = VocabularyCache()  # serves GET /api/vocabulary without the database when nothing changed
+
+@asynccontextmanager
+async def lifespan(app):
+    await run_in_threadpool(init_db)  # make sure the schema is current before serving
+    await broker.start()
+    await word_cache.start()
+    yield
+    await broker.stop()
+    word_cache.close()
+    await get_async_engine().dispose()
+
+app = FastAPI(lifespan=lifespan)
+
+class MetricsMiddleware:
+    """Latency and database query count of every request, by route template (so /api/vocabulary?user_id=5 is one series)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        stats = metrics.track_request()  # the request runs in its own task, so this context is its own
+        status, streaming = 500, False
+
+        async def send_wrapper(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # An event stream stays open for hours, its duration says nothing about performance
+                streaming = any(name == b"content-type" and value.startswith(b"text/event-stream") for name, value in message.get("headers", ()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not streaming:
+                route = scope.get("route")
+                metrics.record_request(scope["method"], route.path if route else "unmatched", status, time.perf_counter() - started, stats)
+
+if config.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    metrics.Callback("vocab_cache_bytes", "Size of this worker's in-memory word lists.", lambda: word_cache.bytes)
+    metrics.Callback("vocab_cache_users", "Word lists held in memory.", lambda: word_cache.stats()["users"])
+    metrics.Callback("vocab_cache_lookups_total", "Word list lookups by outcome.", lambda: {("hit",): word_cache.hits, ("miss",): word_cache.misses}, ("result",), kind="counter")
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,43 +76,231 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 class Word(BaseModel):
     word: str
     user_id: int = 1  # Default user ID, you might want to implement proper authentication
 
+class WordBatch(BaseModel):
+    words: List[str]
+    user_id: int = 1  # Default user ID
+
 class DeleteWordRequest(BaseModel):
     word: str
     user_id: int = 1  # Default user ID
 
+async def after_write(user_id):
+    # Once a write has committed: wake the event stream and bring the cached word list up to date
+    broker.notify()
+    if word_cache.enabled:
+        await word_cache.catch_up(user_id)
+
 @app.post("/api/vocabulary")
-def save_word(word: Word, db: Session = Depends(get_db)):
-    # Check if word already exists for this user
-    existing = db.query(Vocabulary).filter_by(user_id=word.user_id, word=word.word).first()
-    if existing:
+async def save_word(word: Word, db: AsyncSession = Depends(get_async_db)):
+    # Add to database. The unique (user_id, word) index skips words this user already has
+    result = await db.execute(
+        insert_ignore_vocabulary(db.get_bind()).values(word=word.word, user_id=word.user_id, starred=False)
+    )
+    await db.commit()
+    await after_write(word.user_id)
+    if result.rowcount == 0:
         return {"success": False, "message": f"'{word.word}' already exists."}
-    
-    # Add to database
-    new_word = Vocabulary(word=word.word, user_id=word.user_id, starred=False)
-    db.add(new_word)
-    db.commit()
     return {"success": True, "message": f"'{word.word}' has been saved!"}
 
+@app.post("/api/vocabulary/batch")
+async def save_words(batch: WordBatch, db: AsyncSession = Depends(get_async_db)):
+    # Lets the extension push many words in one round trip
+    added = await db.run_sync(bulk_insert_vocabulary, batch.user_id, batch.words)
+    await db.commit()
+    await after_write(batch.user_id)
+    return {"success": True, "added": added, "message": f"{len(added)} new words saved."}
+
+@app.delete("/api/vocabulary/batch")
+async def delete_words(batch: WordBatch, db: AsyncSession = Depends(get_async_db)):
+    removed = await db.run_sync(bulk_delete_vocabulary, batch.user_id, batch.words)
+    await db.commit()
+    await after_write(batch.user_id)
+    return {"success": True, "removed": removed, "message": f"{removed} words removed."}
+
+def vocabulary_etag(user_id, version):
+    return f'W/"vocab-{user_id}-{version}"'
+
 @app.get("/api/vocabulary")
-def get_vocabulary(user_id: int = 1, db: Session = Depends(get_db)):  # Default user ID 1
-    words = db.query(Vocabulary).filter_by(user_id=user_id).all()
-    return [word.word for word in words]
+async def get_vocabulary(user_id: int = 1, limit: Optional[int] = Query(None, ge=1, le=1000), after: Optional[str] = None, if_none_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_async_db)):  # Default user ID 1
+    """
+    The user's words. Without `limit` this is the whole list, as the extension expects.
+    With `limit` (1 to 1000, 100 with only `after`) it is one page, newest first; pass the X-Next-Cursor response header back as `after` for the next page.
+    """
+    # The newest change-log id only moves when the list changes, so it makes a cheap ETag.
+    # A cached list knows its own version, so hot reads don't touch the database at all.
+    entry = await word_cache.get(user_id) if word_cache.enabled else None
+    version = entry.version if entry is not None else await db.run_sync(get_vocabulary_version, user_id)
+    etag = vocabulary_etag(user_id, version)
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    if limit is not None or after is not None:
+        if limit is None:
+            limit = 100  # a cursor alone still means paging
+        try:
+            items, next_cursor = await db.run_sync(query_vocabulary_page, user_id, limit, after)
+        except ValueError:
+            raise HTTPException(status_code=422, detail="invalid cursor")
+        headers = {"ETag": etag}
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+        return JSONResponse([item.word for item in items], headers=headers)
+    if entry is not None:
+        return Response(word_cache.response_body(entry), media_type="application/json", headers={"ETag": etag})
+    words = await db.scalars(select(Vocabulary.word).where(Vocabulary.user_id == user_id))
+    # A plain list of strings needs no jsonable_encoder pass, which is costly on long lists
+    return JSONResponse(words.all(), headers={"ETag": etag})
+
+@app.get("/api/vocabulary/snapshot")
+async def vocabulary_snapshot(user_id: int = 1, fp_rate: float = config.VOCAB_SNAPSHOT_FP_RATE, words: bool = False, if_none_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_async_db)):
+    """
+    The user's word set as a compact binary Bloom filter for "is this word saved?" checks (format in snapshot.py).
+    With `words` the exact list is appended, sorted and front-coded. Poll with If-None-Match: an unchanged list
+    costs a 304 and, when cached, no database access.
+    """
+    if not 0.0001 <= fp_rate <= 0.5:
+        raise HTTPException(status_code=422, detail="fp_rate must be between 0.0001 and 0.5")
+    fp_rate = float(f"{fp_rate:.2g}")  # a handful of distinct filters per user at most
+    entry = await word_cache.get(user_id) if word_cache.enabled else None
+    version = entry.version if entry is not None else await db.run_sync(get_vocabulary_version, user_id)
+    etag = f'W/"snap-{user_id}-{version}-{fp_rate:g}-{int(words)}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    if entry is not None:
+        body = await word_cache.snapshot_body(user_id, entry, fp_rate, words)
+    else:
+        word_list = (await db.scalars(select(Vocabulary.word).where(Vocabulary.user_id == user_id))).all()
+        bloom = await asyncio.to_thread(BloomFilter, word_list, fp_rate)
+        body = encode_snapshot(bloom, version, word_list if words else None)
+    return Response(body, media_type="application/octet-stream", headers={"ETag": etag})
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Size and hit rate of this worker's in-memory word lists."""
+    return word_cache.stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Request, query, LLM and cache metrics in the Prometheus text format (METRICS_ENABLED only)."""
+    if not config.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(metrics.render_metrics(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/api/vocabulary/search")
+async def search_words(q: str, user_id: int = 1, starred_only: bool = False, limit: int = 20, db: AsyncSession = Depends(get_async_db)):
+    """Prefix, case and accent insensitive search over the user's words, best matches first."""
+    if limit < 1 or limit > 200:
+        raise HTTPException(status_code=422, detail="limit must be between 1 and 200")
+    items = await db.run_sync(query_search_vocabulary, user_id, q, starred_only, limit)
+    return JSONResponse([item.word for item in items])
+
+@app.get("/api/vocabulary/changes")
+async def get_changes(since: int = 0, limit: int = 1000, user_id: int = 1, db: AsyncSession = Depends(get_async_db)):
+    """
+    Incremental sync: every add/delete for the user after the `since` cursor.
+    Pass the returned cursor back as `since` next time. `reset` means the cursor is newer than anything
+    the server knows about (e.g. the database was replaced) and the client should start again from 0.
+    """
+    if limit < 1 or limit > 10000:
+        raise HTTPException(status_code=422, detail="limit must be between 1 and 10000")
+    if since > await db.run_sync(get_latest_change_id):
+        return {"changes": [], "cursor": 0, "has_more": False, "reset": True}
+    changes, cursor, has_more = await db.run_sync(get_vocabulary_changes, user_id, since, limit)
+    return {"changes": changes, "cursor": cursor, "has_more": has_more, "reset": False}
+
+@app.get("/api/stats")
+async def user_stats(user_id: int = 1, days: int = 30, db: AsyncSession = Depends(get_async_db)):
+    """Word, star and quiz totals plus words added per day for the last `days` days, from the running counters."""
+    if days < 0 or days > 366:
+        raise HTTPException(status_code=422, detail="days must be between 0 and 366")
+    return await db.run_sync(query_user_stats, user_id, days)
+
+@app.get("/api/vocabulary/events")
+async def vocabulary_events(user_id: Optional[int] = None, since: Optional[int] = None, last_event_id: Optional[str] = Header(None)):
+    """
+    Server-Sent Events: one "changes" event whenever a user's words change, carrying the newest change-log
+    cursor for that user (see events.py). Leave out user_id to hear about every user. Reconnecting with
+    `since` (or the Last-Event-ID header browsers send) first replays anything missed after that cursor.
+    """
+    if since is None and last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    subscription = broker.subscribe(user_id)  # before the catch-up query, so nothing falls in between
+
+    async def stream():
+        try:
+            yield f"retry: {int(config.SYNC_BACKOFF_BASE * 1000)}\n\n"
+            if since is not None:
+                missed = await changed_users(since)
+                for changed_user, cursor in missed.items():
+                    subscription.put(changed_user, cursor)
+            while True:
+                try:
+                    pending = await asyncio.wait_for(subscription.get(), config.VOCAB_EVENTS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield "".join(format_event(changed_user, cursor) for changed_user, cursor in pending.items())
+        finally:
+            broker.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/vocabulary/export")
+async def export_words(user_id: int = 1, format: str = "csv"):
+    """The user's whole vocabulary as CSV or JSON Lines, streamed in batches so memory use doesn't grow with its size."""
+    if format not in FORMATS:
+        raise HTTPException(status_code=422, detail=f"format must be one of {sorted(FORMATS)}")
+    return StreamingResponse(
+        aiter_export(user_id, format),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="vocabulary-{user_id}.{format}"'},
+    )
+
+@app.post("/api/vocabulary/import")
+async def import_words(request: Request, user_id: int = 1, format: str = "csv"):
+    """
+    Add every word in a CSV or JSON Lines request body (see vocab_io.py for the layout). The body is parsed
+    as it arrives and saved in batches, each in its own transaction; words the user already has are skipped.
+    """
+    if format not in FORMATS:
+        raise HTTPException(status_code=422, detail=f"format must be one of {sorted(FORMATS)}")
+    parser = ImportParser(format)
+    pending = []
+    rows = added = 0
+
+    async def flush(batch):
+        async with async_session_scope() as session:
+            added = await session.run_sync(import_rows, user_id, batch)
+        await after_write(user_id)
+        return added
+
+    async for chunk in request.stream():
+        pending.extend(parser.feed(chunk))
+        while len(pending) >= config.VOCAB_IO_BATCH_SIZE:
+            added += await flush(pending[:config.VOCAB_IO_BATCH_SIZE])
+            rows += config.VOCAB_IO_BATCH_SIZE
+            del pending[:config.VOCAB_IO_BATCH_SIZE]
+    pending.extend(parser.close())
+    if pending:
+        added += await flush(pending)
+        rows += len(pending)
+    return {"success": True, "rows": rows, "added": added, "skipped": rows - added, "invalid": parser.invalid}
 
 @app.delete("/api/vocabulary")
-async def delete_word(word_data: DeleteWordRequest, db: Session = Depends(get_db)):
-    word = db.query(Vocabulary).filter_by(
-        user_id=word_data.user_id, 
-        word=word_data.word
-    ).first()
+async def delete_word(word_data: DeleteWordRequest, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(delete(Vocabulary).where(
+        Vocabulary.user_id == word_data.user_id, 
+        Vocabulary.word == word_data.word
+    ))
+    await db.commit()
+    await after_write(word_data.user_id)
     
-    if word:
-        db.delete(word)
-        db.commit()
+    if result.rowcount:
         return {"success": True, "message": f"'{word_data.word}' has been removed!"}
     return {"success": False, "message": f"Word '{word_data.word}' not found."}
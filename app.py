@@ -1,20 +1,22 @@
-from openai import OpenAI
-import random
 import streamlit as st
-import os
-import base64
-from dotenv import load_dotenv
-from auth import register_user, authenticate_user
-from database import get_session, User, Vocabulary, get_user_vocabulary, toggle_star_word, remove_vocabulary_word, get_starred_words
+from auth import register_user, authenticate_user, LoginThrottled
+from database import insert_vocabulary_word, get_sync_cursor, get_oldest_sync_cursor, apply_vocabulary_changes, get_user_context, update_user, get_user_vocabulary_page, get_user_stats, search_vocabulary, toggle_star_word, remove_vocabulary_word, get_starred_words, get_next_quiz_word, record_review, get_enrichments
 from database import init_db
+from assets import build_static_images, static_url
+from sync import OutboxWorker
+from events import ChangeListener
+from llm import LLMGateway
+from quiz_pool import QuizQuestionPool
+from enrichment import VocabularyEnricher
+from writing_review import WritingReviewer, ASPECTS, split_into_chunks
+from srs import GRADES
+import metrics
+import config
 import requests
 import time
-from typing import List, Optional
+from datetime import datetime
 from streamlit_extras.let_it_rain import rain
 
-# Load environment variables
-load_dotenv()
-
 # Set page config first
 st.set_page_config(
     page_title="Language Helper",
@@ -22,23 +24,24 @@ st.set_page_config(
     layout="wide"
 )
 
-def load_css(file):
-    with open(file) as f:
-        st.html(f"<style>{f.read()}</style>")
-css_path = "style.css"
-load_css(css_path)
-
-def get_img_as_base64(file):
-    with open(file, "rb") as f:
-        return base64.b64encode(f.read()).decode()
-
-img=get_img_as_base64("App_Background.jpg")
-sidebar_img = get_img_as_base64("sidebar.jpg")
+@st.cache_resource
+def startup():
+    # Runs once per process rather than on every rerun
+    init_db()  # creates database
+    build_static_images()
+    if config.METRICS_ENABLED and config.METRICS_PORT:
+        metrics.start_metrics_server(config.METRICS_PORT)  # Streamlit has no route of its own for /metrics
+
+@st.cache_resource
+def get_page_style():
+    # style.css plus the background images, which are served from static/ instead of inlined as base64
+    with open("style.css") as f:
+        css = f.read()
+    return f"""<style>
+{css}
 
-page_bg_img = f"""
-<style>
 [data-testid="stAppViewContainer"]{{
-    background-image: url("data:image/jpeg;base64,{img}");
+    background-image: url("{static_url('App_Background.jpg')}");
     background-size: cover;
     position: relative;
 
@@ -49,31 +52,113 @@ page_bg_img = f"""
 }}
 
 [data-testid="stSidebar"]{{
-    background-image: url("data:image/jpeg;base64,{sidebar_img}");
+    background-image: url("{static_url('sidebar.jpg')}");
     background-size: cover;
     position: center;
 }}
-</style>
-"""
+</style>"""
+
+startup()
+
+# Measured from here so the one-off startup work doesn't look like a slow, query-heavy page
+rerun_started = time.perf_counter()
+rerun_stats = metrics.track_request()  # queries and LLM calls made by this rerun (the script thread's context)
 
-st.markdown(page_bg_img, unsafe_allow_html=True)
+st.html(get_page_style())
 
 st.logo(
     "language_helper_logo.png",
     icon_image="language_helper_logo.png",
 )
 
-# Initialize the database
-init_db()  # creates database
-
-# Get API key from environment variables
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-if not OPENAI_API_KEY:
+if config.LLM_BACKEND == "openai" and not config.OPENAI_API_KEY:
     st.error("OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
     st.stop()
 
-client = OpenAI(api_key=OPENAI_API_KEY)
- 
+@st.cache_resource
+def get_outbox_worker():
+    # One background sync worker per process, shared by every session
+    return OutboxWorker().start()
+
+get_outbox_worker()  # starts draining anything left in the outbox from earlier runs
+
+EXTENSION_USER_ID = 1  # the API's default user, which the browser extension saves words under
+
+@st.cache_resource
+def get_change_listener():
+    # One event stream from the API per process; pages only pull changes after it reports some.
+    # Only the extension user's events, replayed from the oldest cursor a user has already imported up to
+    return ChangeListener(user_id=EXTENSION_USER_ID, since=get_oldest_sync_cursor()).start()
+
+@st.cache_resource
+def get_llm():
+    # One gateway per process so its concurrency limit and in-flight dedupe cover every session
+    gateway = LLMGateway()
+    if config.METRICS_ENABLED:
+        cache = gateway.cache
+        metrics.Callback("llm_cache_lookups_total", "LLM response cache lookups by outcome.", lambda: {("hit",): cache.hits, ("miss",): cache.misses}, ("result",), kind="counter")
+    return gateway
+
+def write_stream_as_subheader(chunks):
+    """Render streamed text incrementally as a subheader (the style feedback replies use). Returns the full text."""
+    placeholder = st.empty()
+    text = ""
+    last_render = 0.0
+    for chunk in chunks:
+        text += chunk
+        now = time.perf_counter()
+        if now - last_render > 0.05:  # redraw at most ~20 times a second
+            placeholder.subheader(text)
+            last_render = now
+    placeholder.subheader(text)
+    return text
+
+def generate_quiz_question(word, language):
+    """A question that asks the student to use `word`, served from the cache once enough variants exist."""
+    return get_llm().complete(
+        "quiz_question",
+        {"word": word, "language": language},
+        variants=config.LLM_CACHE_QUESTION_VARIANTS,
+        cache_inputs={"word": word.casefold(), "language": language},
+    )
+
+def stream_quiz_feedback(question, student_response, word):
+    return get_llm().stream("quiz_feedback", {"question": question, "response": student_response, "word": word})
+
+@st.cache_resource
+def get_enricher():
+    # One background job per process; it fills vocabulary_enrichment for everyone's words
+    return VocabularyEnricher(get_llm()).start()
+
+@st.cache_resource
+def get_writing_reviewer():
+    return WritingReviewer(get_llm())
+
+def write_writing_review(student_response):
+    """Review the text aspect by aspect and chunk by chunk in parallel, streaming each part into its own place."""
+    chunks = split_into_chunks(str(student_response))
+    placeholders = {}
+    for aspect_index, (_, heading) in enumerate(ASPECTS):
+        st.subheader(heading)
+        for chunk_index in range(len(chunks)):
+            placeholders[(aspect_index, chunk_index)] = st.empty()
+            placeholders[(aspect_index, chunk_index)].caption("Reviewing...")
+    last_render = {}
+    for aspect_index, chunk_index, text, done, error in get_writing_reviewer().review(chunks):
+        key = (aspect_index, chunk_index)
+        if error is not None:
+            placeholders[key].error(f"Could not review this part: {error}")
+            continue
+        now = time.perf_counter()
+        if done or now - last_render.get(key, 0.0) > 0.05:  # redraw each part at most ~20 times a second
+            placeholders[key].markdown(text)
+            last_render[key] = now
+
+@st.cache_resource
+def get_quiz_pool():
+    # One pool per process: its thread pool bounds concurrent background LLM calls across all sessions
+    return QuizQuestionPool(generate_quiz_question)
+
 def emojiRain():
     rain(
         emoji="🎊",
@@ -83,128 +168,113 @@ def emojiRain():
     )
 
 def add_vocabulary_word(user_id, word):
-    """Add a word to the user's vocabulary and sync with FastAPI server"""
-    session = get_session()
-    # Check if word already exists for this user
-    existing = session.query(Vocabulary).filter_by(user_id=user_id, word=word).first()
-    if existing:
+    """Add a word to the user's vocabulary and queue it for the FastAPI server"""
+    # Returns False when the word already exists for this user
+    if not insert_vocabulary_word(user_id, word, sync=True):
         return False  # Word already exists
     
-    # Add to database
-    new_word = Vocabulary(word=word, starred=False, user_id=user_id)
-    session.add(new_word)
-    session.commit()
-    
-    # Sync with FastAPI server
-    sync_success = sync_vocabulary_with_server(user_id, 'add', word)
-    if not sync_success:
-        print(f"Warning: Failed to sync word '{word}' with FastAPI server")
-    
+    # The outbox worker pushes it to the server in the background
+    get_outbox_worker().wake()
     return True
 
 def import_vocabulary_from_extension(user_id: int) -> None:
 
-    #Fetch words from the browser extension and add them to the user's vocabulary. Only adds words that don't already exist for the user.
+    #Fetch new changes from the browser extension and apply them to the user's vocabulary.
+    #Only the delta since this user's last sync cursor is downloaded, so an idle sync costs one tiny request.
+    version = get_change_listener().version(EXTENSION_USER_ID)  # read first, so changes during the pull aren't marked as seen
     try:
-        response = requests.get("http://localhost:8000/api/vocabulary")
-        response.raise_for_status()
-        words = response.json()
-        
-        if not isinstance(words, list):
-            st.error("Unexpected response format from vocabulary API")
-            return
+        start_cursor = cursor = get_sync_cursor(user_id)
+        latest_ops = {}  # word -> last op seen, so an add followed by a delete cancels out
+        while True:
+            response = requests.get(
+                f"{config.VOCAB_API_URL}/api/vocabulary/changes",
+                params={"since": cursor, "user_id": EXTENSION_USER_ID},
+                timeout=5
+            )
+            response.raise_for_status()
+            delta = response.json()
             
-        session = get_session()
-        imported_count = 0
-        
-        for word in words:
-            if not isinstance(word, str):
+            if not isinstance(delta, dict) or not isinstance(delta.get("changes"), list):
+                st.error("Unexpected response format from vocabulary API")
+                return
+            if delta.get("reset"):
+                # Server no longer knows our cursor, replay its whole log
+                cursor = 0
+                latest_ops.clear()
                 continue
                 
-            # Check if word already exists for user
-            existing = session.query(Vocabulary).filter_by(user_id=user_id, word=word).first()
-            if not existing:
-                vocab = Vocabulary(word=word, starred=False, user_id=user_id)
-                session.add(vocab)
-                imported_count += 1
+            for change in delta["changes"]:
+                word = change.get("word")
+                if isinstance(word, str) and change.get("op") in ("add", "delete"):
+                    latest_ops[word] = change["op"]
+            cursor = delta["cursor"]
+            if not delta.get("has_more"):
+                break
+        st.session_state.extension_version = version
+        
+        if cursor == start_cursor and not latest_ops:
+            return  # nothing changed since the last sync
+        
+        # Words and the new cursor are saved together
+        added = [word for word, op in latest_ops.items() if op == "add"]
+        removed = [word for word, op in latest_ops.items() if op == "delete"]
+        imported_count, removed_count = apply_vocabulary_changes(user_id, added, removed, cursor)
         
         if imported_count > 0:
-            session.commit()
             st.sidebar.success(f"Imported {imported_count} new words from browser extension!")
             
     except requests.exceptions.RequestException as e:
         # Silently fail. extension might not be running
         pass
 
-def sync_vocabulary_with_server(user_id: int, action: str, word: str = None):
-    """
-    Sync vocabulary changes with the FastAPI server
-    
-    Args:
-        user_id: The ID of the current user
-        action: One of 'add', 'delete', 'update_star'
-        word: The word being modified (required for 'add' and 'delete' actions)
-    """
-    try:
-        print(f"Attempting to sync: action={action}, word={word}")  # Debug log
-        if action in ['add', 'delete'] and not word:
-            print("Error: Word is required for add/delete actions")  # Debug log
-            return False
-            
-        session = get_session()
-        
-        if action == 'add':
-            # Check if word exists in database
-            existing = session.query(Vocabulary).filter_by(user_id=user_id, word=word).first()
-            if not existing:
-                print(f"Adding word to FastAPI server: {word}")  # Debug log
-                response = requests.post(
-                    "http://localhost:8000/api/vocabulary",
-                    json={"word": word, "user_id": user_id},
-                    timeout=5
-                )
-                print(f"Server response: {response.status_code}, {response.text}")  # Debug log
-                return response.status_code == 200
-            else:
-                print(f"Word '{word}' already exists in the database")  # Debug log
-                return False
-                
-        elif action == 'delete':
-            print(f"Deleting word from FastAPI server: {word}")  # Debug log
-            response = requests.delete(
-                "http://localhost:8000/api/vocabulary",
-                json={"word": word, "user_id": user_id},
-                timeout=5
-            )
-            print(f"Server response: {response.status_code}, {response.text}")  # Debug log
-            return response.status_code == 200
-            
-        elif action == 'update_star':
-            # For star updates, we don't need to sync with the FastAPI server
-            # since the extension only needs the word list
-            print("Star update - no sync needed with FastAPI")  # Debug log
-            return True
-            
-    except requests.exceptions.RequestException as e:
-        error_msg = f"Failed to sync with vocabulary server: {str(e)}"
-        print(error_msg)  # Debug log
-        st.error(error_msg)
-        return False
+def extension_changed():
+    listener = get_change_listener()
+    return not listener.connected or st.session_state.get("extension_version") != listener.version(EXTENSION_USER_ID)
+
+@st.fragment(run_every=config.SYNC_EVENTS_REFRESH_INTERVAL)
+def watch_extension_changes():
+    # Only looks at the listener's in-memory cursor; reruns the page when a pushed change hasn't been pulled yet
+    listener = get_change_listener()
+    if listener.connected and extension_changed():
+        st.rerun(scope="app")
 
 with st.container(key="title_container"):
     st.title("Where Voices Meet")
 
-menu = st.sidebar.selectbox("", ["Login", "Register", "My Settings", "Quiz me", "Revise my writing", "My Vocabulary List"]) #adds a dropdown menu on the sidebar 
+menu = st.sidebar.selectbox("", ["Login", "Register", "My Settings", "Quiz me", "Revise my writing", "My Vocabulary List", "My Progress"]) #adds a dropdown menu on the sidebar 
  
 # Session management
 if "logged_in" not in st.session_state: 
     st.session_state.logged_in = False
     st.session_state.username = None
+    st.session_state.user_id = None
+    st.session_state.user_context = None
     st.session_state.q_generated = False
     st.session_state.currentQuestion = None
     st.session_state.currentWord = None
     st.session_state.show_registration_success = False
 
+def log_in(user):
+    st.session_state.logged_in = True
+    st.session_state.username = user.username
+    st.session_state.user_id = user.id
+    st.session_state.user_context = user
+
+def current_user():
+    """The logged-in user's UserContext. Only read from the database after login or update_user_info."""
+    if st.session_state.user_context is None and st.session_state.user_id is not None:
+        st.session_state.user_context = get_user_context(st.session_state.user_id)
+    return st.session_state.user_context
+
+def update_user_info(user_id, new_username=None, new_password=None, new_newLang=None):
+    user = update_user(user_id, username=new_username, password=new_password, newLang=new_newLang)  # need to hash password before storing
+    # Drop the cached context so the next current_user() reads the new values
+    st.session_state.user_context = None
+    if user:
+        st.session_state.username = user.username
+        return True
+    return False  # User not found
+
 if menu == "Register":
     with st.container(key="login_register_container"):
         st.markdown("<div class='form-container'>", unsafe_allow_html=True)
@@ -225,23 +295,24 @@ if menu == "Register":
             st.error("Username cannot be empty.")
         elif not password.strip():
             st.error("Password cannot be empty.")
-        elif register_user(username, password):
-            # Set login state and username
-            st.session_state.logged_in = True
-            st.session_state.username = username
-            
-            # Get user ID to import vocabulary
-            session = get_session()
-            user = session.query(User).filter_by(username=username).first()
-            
-            # Import words from browser extension
-            import_vocabulary_from_extension(user.id)
-            
-            emojiRain()
-            st.session_state.show_registration_success = True
-            st.rerun()  # This will cause the success message to show on the next run
         else:
-            st.error("Username already exists. Please try a different one.")
+            try:
+                user = register_user(username, password, ip=st.context.ip_address)
+            except LoginThrottled as e:
+                st.error(str(e))
+            else:
+                if user:
+                    # Set login state and remember the user for the rest of the session
+                    log_in(user)
+                    
+                    # Import words from browser extension
+                    import_vocabulary_from_extension(user.id)
+                    
+                    emojiRain()
+                    st.session_state.show_registration_success = True
+                    st.rerun()  # This will cause the success message to show on the next run
+                else:
+                    st.error("Username already exists. Please try a different one.")
 
 elif menu == "Login":
     with st.container(key="login_register_container"):
@@ -254,63 +325,49 @@ elif menu == "Login":
         
         
         if login_button:
-            if authenticate_user(username, password):
-                st.session_state.logged_in = True
-                st.session_state.username = username
-                session = get_session()
-                user = session.query(User).filter_by(username=username).first()
-            
-                # Import words from browser extension
-                import_vocabulary_from_extension(user.id)
-            
-                st.success(f"Welcome back, {username}!")
-                st.rerun()
+            try:
+                user = authenticate_user(username, password, ip=st.context.ip_address)
+            except LoginThrottled as e:
+                st.error(str(e))
             else:
-                st.error("Invalid username or password. Please try again.")
+                if user:
+                    log_in(user)
+                
+                    # Import words from browser extension
+                    import_vocabulary_from_extension(user.id)
+                
+                    st.success(f"Welcome back, {username}!")
+                    st.rerun()
+                else:
+                    st.error("Invalid username or password. Please try again.")
 
 if st.session_state.logged_in:
     st.sidebar.markdown(f'<p style="color: #8fa6bb; font-size: 20px; font-family: times new roman">Logged in as {st.session_state.username}</p>', unsafe_allow_html=True)
     if st.sidebar.button("Log out"):
         st.session_state.logged_in = False
         st.session_state.username = None
+        st.session_state.user_id = None
+        st.session_state.user_context = None
         st.success("You have logged out.")
         
 
 
 
-def update_user_info(username, new_username=None, new_password=None, new_newLang=None):
-    session = get_session()
-    user = session.query(User).filter_by(username=username).first()  # Find the user
-    if user:
-        if new_username:
-            user.username = new_username  # Update username
-        if new_password:
-            user.password = new_password  # need to hash password before storing
-        if new_newLang:
-            user.newLang = new_newLang
-        session.commit()  # Save changes
-        return True
-    return False  # User not found
-
-def get_newLang(username):
-    session = get_session()
-    user = session.query(User).filter_by(username=username).first()  # Find the user
-    if user:
-        return user.newLang
-    return "No user found"
-
-
 if menu=="My Settings":
     if st.session_state.logged_in:
         with st.container(key="login_register_container"):
             st.markdown("<div class='form-container'>", unsafe_allow_html=True)
             st.subheader("Change your settings!")
-            st.subheader("Current Language: " + str(get_newLang(st.session_state.username))) 
+            st.subheader("Current Language: " + str(current_user().newLang)) 
             newLang = st.selectbox("New Language", ["Spanish","Chinese"])
             st.markdown("</div>", unsafe_allow_html=True)
             
             if st.button("Save"):
-                update_user_info(st.session_state.username, new_newLang=newLang)
+                update_user_info(current_user().id, new_newLang=newLang)
+                # Start preparing quiz questions in the new language for every starred word
+                user = current_user()
+                if user:
+                    get_quiz_pool().warm_many(user.id, get_starred_words(user.id), newLang)
                 st.rerun()
 
     else:
@@ -322,13 +379,13 @@ if menu=="My Vocabulary List":
         with st.container(key="login_register_container"):
             st.subheader("My Vocabulary List")
         
-            # Get current user
-            session = get_session()
-            user = session.query(User).filter_by(username=st.session_state.username).first()
+            user = current_user()
         
-            # Sync with browser extension
-            if user:
+            # Sync with browser extension, but only when the API's event stream says something changed.
+            # Without a stream (API down or starting) fall back to checking on every rerun.
+            if user and extension_changed():
                 import_vocabulary_from_extension(user.id)
+            watch_extension_changes()
         
             # Add new word
             with st.expander("Add a new word", expanded=False):
@@ -336,7 +393,6 @@ if menu=="My Vocabulary List":
                 if st.button("Add Word") and new_word:
                     if add_vocabulary_word(user.id, new_word):
                         st.success(f"Added '{new_word}' to your vocabulary!")
-                        sync_vocabulary_with_server(user.id, 'add', new_word)
                         st.rerun() 
                     else:
                         st.warning(f"'{new_word}' is already in your vocabulary!")
@@ -344,38 +400,93 @@ if menu=="My Vocabulary List":
             # Filter options
             show_starred_only = st.checkbox("Show starred words only")
         
-            # Display vocabulary list
-            vocab_list = get_user_vocabulary(user.id, show_starred_only=show_starred_only)
+            # The count comes from the running totals, the list itself is loaded one page at a time
+            stats = get_user_stats(user.id, days=0)
+            total_words = stats["starred"] if show_starred_only else stats["words"]
         
-            if not vocab_list:
+            if not total_words:
                 st.info("No words found. Add some words to get started!")
             else:
                 # Display word count
-                st.write(f"You have {len(vocab_list)} words in your vocabulary")
+                st.write(f"You have {total_words} words in your vocabulary")
             
                 # Add a search box
-                search_term = st.text_input("Search your vocabulary:", "")
+                search_term = st.text_input("Search your vocabulary:", "").strip()
             
-                for item in vocab_list:
-                    # Skip words that don't match search
-                    if search_term.lower() not in item.word.lower():
-                        continue
-                    
+                # Stack of keyset cursors, one per page visited, so Previous/Next stay stable across reruns.
+                # Start over whenever the filter or the search changes.
+                page_key = (show_starred_only, search_term)
+                if st.session_state.get("vocab_page_key") != page_key:
+                    st.session_state.vocab_page_key = page_key
+                    st.session_state.vocab_cursors = [None]
+                cursors = st.session_state.vocab_cursors
+            
+                if search_term:
+                    # Indexed prefix search (accent and case insensitive), best matches only
+                    vocab_page = search_vocabulary(user.id, search_term, starred_only=show_starred_only, limit=config.VOCAB_PAGE_SIZE)
+                    next_cursor = None
+                else:
+                    vocab_page, next_cursor = get_user_vocabulary_page(
+                        user.id,
+                        limit=config.VOCAB_PAGE_SIZE,
+                        after=cursors[-1],
+                        starred_only=show_starred_only,
+                    )
+                if not vocab_page and len(cursors) > 1:
+                    # The last word on this page was removed, step back a page
+                    cursors.pop()
+                    st.rerun()
+                if not vocab_page:
+                    st.info("No words match your search.")
+            
+                # Translations and examples come straight from the table; missing ones are queued, never waited for
+                # Looked up in the language each word was saved in, which isn't the current one after a switch
+                enrichment = {}
+                if config.ENRICHMENT_ENABLED:
+                    by_language = {}
+                    for item in vocab_page:
+                        by_language.setdefault(item.language or user.newLang, []).append(item.word)
+                    for language, words in by_language.items():
+                        found = get_enrichments(words, language, user.nativeLang)
+                        enrichment.update(((language, word), info) for word, info in found.items())
+                        get_enricher().request([word for word in words if word not in found], language, user.nativeLang)
+            
+                for item in vocab_page:
                     col1, col2, col3 = st.columns([6, 1, 1])
                     with col1:
                         st.write(f"{item.word}")
+                        info = enrichment.get((item.language or user.newLang, item.word))
+                        if info and info.translation:
+                            st.caption(f"{info.translation}" + (f" · {info.definition}" if info.definition else ""))
+                        if info and info.example:
+                            st.caption(f"_{info.example}_")
                     with col2:
                         star_emoji = "⭐" if item.starred else "☆"
                         if st.button(star_emoji, key=f"star_{item.id}"):
                             toggle_star_word(item.id, user.id)
-                            sync_vocabulary_with_server(user.id, 'update_star')
+                            if not item.starred:
+                                # Newly starred: have quiz questions ready before the user asks for one
+                                get_quiz_pool().warm(user.id, item.word, user.newLang)
                             st.rerun()
                     with col3:
                         if st.button("🗑️", key=f"del_{item.id}"):
-                            remove_vocabulary_word(item.id, user.id)
-                            sync_vocabulary_with_server(user.id, 'delete', item.word)
+                            remove_vocabulary_word(item.id, user.id)  # queues the removal for the server
+                            get_outbox_worker().wake()
                             st.rerun()
                     st.write("---")
+            
+                # Page navigation
+                prev_col, page_col, next_col = st.columns([1, 4, 1])
+                with prev_col:
+                    if st.button("← Previous", key="vocab_prev", disabled=len(cursors) == 1):
+                        cursors.pop()
+                        st.rerun()
+                with page_col:
+                    st.write(f"Page {len(cursors)}")
+                with next_col:
+                    if st.button("Next →", key="vocab_next", disabled=next_cursor is None):
+                        cursors.append(next_cursor)
+                        st.rerun()
     else:
         st.error("Please log in to view your vocabulary list.")
 
@@ -385,29 +496,26 @@ if menu=="Quiz me":
             st.subheader("Quiz Me")
             generate_question_button = st.button("Generate Quiz Question", key="buttons")
         
-            # Get current user
-            session = get_session()
-            user = session.query(User).filter_by(username=st.session_state.username).first()
+            user = current_user()
         
-            # Get starred words for quiz
-            starred_words = get_starred_words(user.id)
+            # The starred word due soonest, straight off the (user_id, starred, due_at) index
+            next_word = get_next_quiz_word(user.id)
         
-            if not starred_words:
+            if not next_word:
                 st.warning("You don't have any starred words yet. Star some words in your vocabulary list first!")
             else:
+                if next_word.due_at and next_word.due_at > datetime.utcnow() and not st.session_state.q_generated:
+                    st.info("No words are due for review right now. You can still practise the next one early.")
                 if generate_question_button:
-                    random_word = random.choice(starred_words)
-                    response = client.chat.completions.create(
-                        model="gpt-4o",
-                        messages=[
-                            {"role": "system", "content": "You are a language teacher helping a student learn a new language through quizzing them about new vocabulary words."},
-                            {"role": "user", "content": f"You are talking directly to the student. Write a question that will prompt the student to put the word '{random_word}' into context. Please respond in {get_newLang(st.session_state.username)}."}
-                        ]
-                    )
-                    reply = response.choices[0].message.content
+                    quiz_language = user.newLang
+                    # A pre-generated question is instant; only a cold pool waits on the LLM. Either way the pool is topped up.
+                    reply = get_quiz_pool().pop(user.id, next_word.word, quiz_language)
+                    if reply is None:
+                        reply = generate_quiz_question(next_word.word, quiz_language)
                     st.session_state.q_generated = True
                     st.session_state.currentQuestion = reply
-                    st.session_state.currentWord = random_word
+                    st.session_state.currentWord = next_word.word
+                    st.session_state.currentWordId = next_word.id
                    
                 
                 if st.session_state.q_generated:
@@ -417,21 +525,31 @@ if menu=="Quiz me":
                     student_response = st.text_area("Your Answer", "Your Answer Here...", key="student_response")
                     if st.button("Submit and get feedback!", key="submit_button"):
                         emojiRain()
-                        response = client.chat.completions.create(
-                            model="gpt-4o",
-                            messages=[
-                                {"role": "system", "content": "You are a language teacher helping a student learn a new language by giving them feedback on their writing."},
-                                {"role": "user", "content": f"The student is responding to this prompt: {st.session_state.currentQuestion}\nThe student's writing: {student_response}\nThe word they were supposed to use is: {st.session_state.currentWord}\nPlease check if they used the word correctly and naturally in their response. List at least 1 strength and give the student 1-2 pieces of feedback on their writing. Evaluate the student's writing with an emphasis on the student’s contextualization of the vocabulary word. Please respond in English and respond as if you were speaking directly to the student."}
-                            ]
-                        )
-                        reply = response.choices[0].message.content
                         with st.container(key="reply_container"):
-                            st.subheader(reply)
+                            # Shown token by token as the model writes it
+                            write_stream_as_subheader(stream_quiz_feedback(st.session_state.currentQuestion, student_response, st.session_state.currentWord))
+                        # Ask how it went so the word can be rescheduled
+                        st.session_state.gradeWord = (st.session_state.currentWordId, st.session_state.currentWord)
                         st.session_state.q_generated = False
                         st.session_state.currentQuestion = None
                         st.session_state.currentWord = None
                     st.markdown("</div>", unsafe_allow_html=True)
 
+                if st.session_state.get("gradeWord"):
+                    word_id, word = st.session_state.gradeWord
+                    st.write(f"How well did you know '{word}'?")
+                    grade = None
+                    for col, (label, quality) in zip(st.columns(len(GRADES)), GRADES):
+                        with col:
+                            if st.button(label, key=f"grade_{quality}"):
+                                grade = quality
+                    if grade is not None:
+                        due_at = record_review(word_id, user.id, grade)
+                        st.session_state.gradeWord = None
+                        if due_at:
+                            days = max(1, round((due_at - datetime.utcnow()).total_seconds() / 86400))
+                            st.success(f"'{word}' will come back in {days} day{'s' if days != 1 else ''}.")
+
 if menu=="Revise my writing":
     with st.container(key="login_register_container"):
         st.subheader("Revise my writing")
@@ -439,13 +557,33 @@ if menu=="Revise my writing":
             student_response = st.text_area("Student writing", "your ideas here....", key="student_response")
             if st.button("Submit and get feedback!"):
                 emojiRain()
-                response = client.chat.completions.create(
-                    model="gpt-4o",  # Use "gpt-3.5-turbo" for the cheaper model
-                    messages=[
-                        {"role": "system", "content": "You are a language teacher helping a student learn a new language by giving them feedback on their writing."},
-                        {"role": "user", "content": "This is the student's writing: " + str(student_response) + "\n Please give the student feedback on social convention. For example, give feedback on whether the student's writing aligns with the country's social customs or whether the words and phrases the student is using are culturally appropriate. If the student spoke this way, would they sound like a native speaker? If not, how can they improve? Also give feedback on the student's grammar or in any areas in which there is room for improvement. Please respond as if you are speaking directly to the student and respond in English."}
-                    ]
-                )
-                reply = response.choices[0].message.content
-            
-                st.subheader(reply)
\ No newline at end of file
+                # Each part is shown as soon as its review comes back
+                write_writing_review(student_response)
+
+if menu=="My Progress":
+    if st.session_state.logged_in:
+        with st.container(key="login_register_container"):
+            st.subheader("My Progress")
+            # Running totals kept with every write, so this page never scans the word list
+            stats = get_user_stats(current_user().id, days=30)
+            words_col, starred_col, quiz_col = st.columns(3)
+            words_col.metric("Words", stats["words"])
+            starred_col.metric("Starred", stats["starred"], f"{stats['starred_ratio']:.0%} of your words" if stats["starred_ratio"] is not None else None, delta_color="off")
+            quiz_col.metric("Quiz answers", stats["quizzes"], f"{stats['correct_rate']:.0%} correct" if stats["correct_rate"] is not None else None, delta_color="off")
+            st.write("Words added in the last 30 days")
+            days = stats["added_per_day"]
+            st.bar_chart({"day": [d["day"] for d in days], "words added": [d["added"] for d in days]}, x="day", y="words added")
+    else:
+        st.error("Please log in to see your progress.")
+
+rerun_seconds = time.perf_counter() - rerun_started
+metrics.record_rerun(menu, rerun_seconds, rerun_stats)
+if config.SHOW_PERF_PANEL:
+    with st.sidebar.expander("Performance of this rerun"):
+        st.caption(f"{rerun_seconds * 1000:.0f} ms in total")
+        st.caption(f"{rerun_stats.queries} database queries, {rerun_stats.query_seconds * 1000:.0f} ms")
+        st.caption(f"{rerun_stats.llm_calls} LLM calls, {rerun_stats.llm_seconds * 1000:.0f} ms")
+        cache_stats = get_llm().cache.stats()
+        st.caption(f"LLM cache since start: {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%})")
+        for seconds, statement in rerun_stats.slow_queries:
+            st.caption(f"Slow query, {seconds * 1000:.0f} ms: {statement}")
@@ -0,0 +1,44 @@
+"""
+Static images for the Streamlit app.
+
+The background images are shown at screen size, so full-resolution originals are wasted bandwidth. Resized,
+recompressed copies are written to static/, which Streamlit serves at app/static/ (server.enableStaticServing in
+.streamlit/config.toml); the page CSS references them by URL instead of inlining them as base64 on every rerun.
+
+    python -m assets          # rebuild the copies after changing an original
+"""
+import os
+
+from PIL import Image
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(APP_DIR, "static")
+
+# original -> (file in static/, max width in pixels)
+STATIC_IMAGES = {
+    "App_Background.jpg": ("app_background.jpg", 1280),
+    "sidebar.jpg": ("sidebar.jpg", 640),
+}
+JPEG_QUALITY = 70
+
+def static_url(name):
+    return f"app/static/{STATIC_IMAGES[name][0]}"
+
+def build_static_images(force=False):
+    """Write resized copies of the originals to static/, skipping ones that already exist unless force is set."""
+    os.makedirs(STATIC_DIR, exist_ok=True)
+    built = []
+    for source, (target, max_width) in STATIC_IMAGES.items():
+        target_path = os.path.join(STATIC_DIR, target)
+        if os.path.exists(target_path) and not force:
+            continue
+        with Image.open(os.path.join(APP_DIR, source)) as image:
+            if image.width > max_width:
+                image = image.resize((max_width, round(image.height * max_width / image.width)), Image.LANCZOS)
+            image.convert("RGB").save(target_path, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+        built.append(target)
+    return built
+
+if __name__ == "__main__":
+    for name in build_static_images(force=True):
+        print(f"Wrote static/{name} ({os.path.getsize(os.path.join(STATIC_DIR, name)) // 1024} KB)")
@@ -1,18 +1,154 @@
-from database import User, get_session
-from utils import hash_password, check_password
-
-def register_user(username, password):
-    session = get_session() #opens a database session
-    if session.query(User).filter_by(username=username).first(): #checking if this username already exists
-        return False  # Username already exists
-    new_user = User(username=username, password=hash_password(password), nativeLang="English", newLang="Spanish", proficiency="Beginner") #hash password -> encrypt the passwords before storing it
-    session.add(new_user) #add new user to database
-    session.commit() #save changes to the database
-    return True #indicates successful registration
-
-def authenticate_user(username, password):
-    session = get_session()
-    user = session.query(User).filter_by(username=username).first() #fetches user with matching username
-    if user and check_password(password, user.password):
-        return True
-    return False
+"""
+Registration and login.
+
+bcrypt is deliberately slow, so it never runs on the caller's thread: hashes go through a small bounded pool
+(one worker per core by default) and a login is turned away when too many are already queued. Failed logins
+are also limited per username and per client IP, so a credential-stuffing burst is rejected before it costs any
+hashing; a successful login clears both, so users sharing an IP behind a NAT or proxy don't lock each other out.
+Stored hashes made with a different work factor than BCRYPT_ROUNDS are upgraded on the next login.
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from database import User, session_scope, make_user_context
+from utils import hash_password, check_password, needs_rehash
+
+class LoginThrottled(Exception):
+    """Too many attempts, or the hashing pool is full. retry_after is a hint in seconds."""
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class AttemptLimiter:
+    """At most max_attempts (failed ones, as auth uses it) per key within a sliding window of window seconds."""
+    def __init__(self, max_attempts, window):
+        self.max_attempts = max_attempts
+        self.window = window
+        self._lock = threading.Lock()
+        self._attempts = defaultdict(deque)
+
+    def check(self, key):
+        """0 if another attempt for key is allowed, otherwise the seconds until it would be. Counts nothing."""
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._attempts.get(key)
+            if not attempts:
+                return 0
+            while attempts and now - attempts[0] > self.window:
+                attempts.popleft()
+            if len(attempts) >= self.max_attempts:
+                return self.window - (now - attempts[0])
+            return 0
+
+    def hit(self, key):
+        """Count an attempt for key."""
+        now = time.monotonic()
+        with self._lock:
+            self._attempts[key].append(now)
+            if len(self._attempts) > 10000:
+                self._prune(now)
+
+    def reset(self, key):
+        with self._lock:
+            self._attempts.pop(key, None)
+
+    def _expired(self, attempts, now):
+        return not attempts or now - attempts[-1] > self.window
+
+    def _prune(self, now):
+        for key in [key for key, attempts in self._attempts.items() if self._expired(attempts, now)]:
+            del self._attempts[key]
+
+class HashPool:
+    """Runs bcrypt on a fixed number of threads, refusing work once max_pending calls are queued or running."""
+    def __init__(self, workers=None, max_pending=None):
+        workers = workers or config.AUTH_HASH_WORKERS
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(max_pending or config.AUTH_HASH_MAX_PENDING)
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise LoginThrottled("Too many logins in progress, please try again in a moment.")
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self.run(hash_password, password)
+
+    def check(self, password, hashed):
+        return self.run(check_password, password, hashed)
+
+_hash_pool = None
+_user_limiter = None
+_ip_limiter = None
+_setup_lock = threading.Lock()
+
+def get_hash_pool(): # one pool per process
+    global _hash_pool, _user_limiter, _ip_limiter
+    if _hash_pool is None:
+        with _setup_lock:
+            if _hash_pool is None:
+                _user_limiter = AttemptLimiter(config.AUTH_MAX_ATTEMPTS_PER_USER, config.AUTH_ATTEMPT_WINDOW)
+                _ip_limiter = AttemptLimiter(config.AUTH_MAX_ATTEMPTS_PER_IP, config.AUTH_ATTEMPT_WINDOW)
+                _hash_pool = HashPool()
+    return _hash_pool
+
+def _limits(username=None, ip=None):
+    get_hash_pool()
+    return [(limiter, key) for limiter, key in ((_ip_limiter, ip), (_user_limiter, username)) if key is not None]
+
+def _throttle(username=None, ip=None):
+    """Raise LoginThrottled if the username or IP has too many recent failed logins."""
+    for limiter, key in _limits(username, ip):
+        retry_after = limiter.check(key)
+        if retry_after:
+            message = f"Too many attempts. Please try again in {int(retry_after) + 1} seconds."
+            raise LoginThrottled(message, retry_after)
+
+def register_user(username, password, ip=None):
+    """Create the user. Returns its UserContext, or None if the username is taken. Raises LoginThrottled."""
+    _throttle(ip=ip)
+    with session_scope() as session: #checking if this username already exists, before paying for a hash
+        if session.query(User.id).filter_by(username=username).first():
+            return None  # Username already exists
+    hashed = get_hash_pool().hash(password) #hash password -> encrypt the passwords before storing it
+    with session_scope() as session: #opens a database session that is committed and closed on exit
+        if session.query(User.id).filter_by(username=username).first(): # registered by someone else meanwhile
+            return None
+        new_user = User(username=username, password=hashed, nativeLang="English", newLang="Spanish",
+                        proficiency="Beginner")
+        session.add(new_user) #add new user to database
+        session.flush() # assigns new_user.id
+        return make_user_context(new_user)
+
+def verify_login(username, password):
+    """Check a password without any throttling. Returns the user's UserContext, or None."""
+    with session_scope() as session:
+        user = session.query(User).filter_by(username=username).first() #fetches user with matching username
+        stored_hash = user.password if user else None
+        context = make_user_context(user) if user else None
+    if not stored_hash or not get_hash_pool().check(password, stored_hash):
+        return None
+    if needs_rehash(stored_hash):
+        # Upgrade to the configured work factor while we have the plain password. Skipped if the password changed
+        # meanwhile.
+        new_hash = get_hash_pool().hash(password)
+        with session_scope() as session:
+            session.query(User).filter_by(id=context.id, password=stored_hash).update({"password": new_hash})
+    return context
+
+def authenticate_user(username, password, ip=None):
+    """Returns the user's UserContext if the password matches, otherwise None. Raises LoginThrottled."""
+    _throttle(username=username, ip=ip)
+    context = verify_login(username, password)
+    for limiter, key in _limits(username, ip):
+        if context:
+            limiter.reset(key) # only failures count, and a success clears them
+        else:
+            limiter.hit(key)
+    return context
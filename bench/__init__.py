@@ -0,0 +1 @@
+"""Performance measurement tools for the vocabulary API and database helpers."""
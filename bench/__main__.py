@@ -0,0 +1,35 @@
+"""
+Run the micro-benchmarks and the in-process API load test together and write one JSON result.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m bench.datagen --users 100000 --rows 10000000
+    DATABASE_URL=sqlite:////tmp/bench.db python -m bench --output results-$(git rev-parse --short HEAD).json
+    python -m bench.compare results-abc123.json results-def456.json
+"""
+import argparse
+import asyncio
+
+from bench import asgi_load, micro
+from bench.report import write
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=50, help="timed runs of each micro-benchmark")
+    parser.add_argument("--auth-repeat", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=500, help="requests per API endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--output", "-o", help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+
+    micro_result = micro.run(args.repeat, args.auth_repeat)
+    api_result = asyncio.run(asgi_load.run(args.requests, args.concurrency))
+    benchmarks = {f"micro.{name}": result for name, result in micro_result["benchmarks"].items()}
+    benchmarks.update({f"api.{name}": result for name, result in api_result["benchmarks"].items()})
+    write({
+        "environment": micro_result["environment"],
+        "dataset": micro_result["dataset"],
+        "concurrency": args.concurrency,
+        "benchmarks": benchmarks,
+    }, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Concurrent HTTP load test against a running api_app server.
+
+    uvicorn api_app:app --port 8000
+    python -m bench.api_load --url http://localhost:8000 --concurrency 64 --duration 10
+
+Each client loops over a mix of list, save and delete requests, like many browser extensions polling at once.
+Prints (or writes) latency percentiles and requests per second for each kind of request and for the whole mix,
+as JSON that bench.compare can diff.
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+import httpx
+
+from bench.report import environment, summarize, write
+
+async def client_loop(http, user_id, deadline, latencies, errors):
+    rng = random.Random(user_id)
+    while time.perf_counter() < deadline:
+        word = f"load-{user_id}-{rng.randrange(200)}"
+        roll = rng.random()
+        if roll < 0.7:
+            name, method, kwargs = "GET /api/vocabulary", "GET", {"params": {"user_id": user_id}}
+        elif roll < 0.9:
+            name, method, kwargs = "POST /api/vocabulary", "POST", {"json": {"word": word, "user_id": user_id}}
+        else:
+            name, method, kwargs = "DELETE /api/vocabulary", "DELETE", {"json": {"word": word, "user_id": user_id}}
+        start = time.perf_counter()
+        try:
+            response = await http.request(method, "/api/vocabulary", **kwargs)
+            errors[name] += response.status_code >= 400
+        except httpx.HTTPError:
+            errors[name] += 1
+            continue
+        latencies[name].append(time.perf_counter() - start)
+
+async def seed(http, users, words_per_user):
+    for user_id in range(1, users + 1):
+        words = [f"seed-{user_id}-{i}" for i in range(words_per_user)]
+        await http.post("/api/vocabulary/batch", json={"words": words, "user_id": user_id})
+
+async def run(url, concurrency, duration, users, words_per_user, transport=None):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30, transport=transport) as http:
+        await seed(http, users, words_per_user)
+        latencies, errors = defaultdict(list), defaultdict(int)
+        deadline = time.perf_counter() + duration
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            client_loop(http, (i % users) + 1, deadline, latencies, errors) for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+    names = sorted(latencies.keys() | errors.keys())
+    benchmarks = {name: summarize(latencies[name], errors[name], elapsed) for name in names}
+    benchmarks["mix"] = summarize([t for name in names for t in latencies[name]], sum(errors.values()), elapsed)
+    return {
+        "environment": environment(),
+        "url": url,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "benchmarks": benchmarks,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--words-per-user", type=int, default=200)
+    parser.add_argument("--output", "-o", help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+    result = asyncio.run(run(args.url, args.concurrency, args.duration, args.users, args.words_per_user))
+    write(result, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+In-process load test of every api_app endpoint, through its ASGI app (no server, no sockets).
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m bench.asgi_load --requests 500 --concurrency 16 --output api.json
+
+Run it against a dataset made by bench.datagen. Each endpoint gets --requests requests from --concurrency
+concurrent clients; exports and imports get a tenth of that. Reads use the heaviest user (1) and the median one.
+Writes go to a scratch user past the last generated one and are deleted afterwards.
+/api/vocabulary/events is left out because it is a long-lived stream, not a request, and /metrics is only
+measured with METRICS_ENABLED=1 (which also puts the metrics middleware on every other request). Prints (or
+writes) JSON.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from sqlalchemy import delete, func, select
+
+import config
+from bench.report import environment, summarize, write
+from database import User, Vocabulary, init_db, session_scope
+
+SEARCH_PREFIXES = ["ca", "ma", "to", "re", "de", "lla", "chi", "pu"]
+
+def scenarios(users):
+    """(name, share of --requests, request factory) for every endpoint. Factories take the request number."""
+    heavy, median, scratch = 1, max(1, users // 2), users + 10_000
+
+    def csv_body(i):
+        return "word\n" + "".join(f"import-{i}-{k}\n" for k in range(1000))
+
+    return [
+        ("GET /api/vocabulary [heavy]", 1, lambda i: ("GET", "/api/vocabulary", {"params": {"user_id": heavy}})),
+        ("GET /api/vocabulary [median]", 1, lambda i: ("GET", "/api/vocabulary", {"params": {"user_id": median}})),
+        ("GET /api/vocabulary [304]", 1, lambda i: ("GET", "/api/vocabulary", {"params": {"user_id": heavy}, "etag": heavy})),
+        ("GET /api/vocabulary?limit=100 [heavy]", 1, lambda i: ("GET", "/api/vocabulary", {"params": {"user_id": heavy, "limit": 100}})),
+        ("GET /api/vocabulary/snapshot [heavy]", 1, lambda i: ("GET", "/api/vocabulary/snapshot", {"params": {"user_id": heavy}})),
+        ("GET /api/vocabulary/search [heavy]", 1, lambda i: ("GET", "/api/vocabulary/search", {"params": {"user_id": heavy, "q": SEARCH_PREFIXES[i % len(SEARCH_PREFIXES)]}})),
+        ("GET /api/vocabulary/changes [heavy]", 1, lambda i: ("GET", "/api/vocabulary/changes", {"params": {"user_id": heavy, "since": 0, "limit": 1000}})),
+        ("GET /api/vocabulary/export [median]", 0.1, lambda i: ("GET", "/api/vocabulary/export", {"params": {"user_id": median, "format": "jsonl"}})),
+        ("GET /api/stats [heavy]", 1, lambda i: ("GET", "/api/stats", {"params": {"user_id": heavy, "days": 30}})),
+        ("GET /api/cache/stats", 1, lambda i: ("GET", "/api/cache/stats", {})),
+        ("POST /api/vocabulary", 1, lambda i: ("POST", "/api/vocabulary", {"json": {"word": f"asgi-{i}", "user_id": scratch}})),
+        ("DELETE /api/vocabulary", 1, lambda i: ("DELETE", "/api/vocabulary", {"json": {"word": f"asgi-{i}", "user_id": scratch}})),
+        ("POST /api/vocabulary/batch", 1, lambda i: ("POST", "/api/vocabulary/batch", {"json": {"words": [f"batch-{i}-{k}" for k in range(50)], "user_id": scratch}})),
+        ("DELETE /api/vocabulary/batch", 1, lambda i: ("DELETE", "/api/vocabulary/batch", {"json": {"words": [f"batch-{i}-{k}" for k in range(50)], "user_id": scratch}})),
+        ("POST /api/vocabulary/import [1000 rows]", 0.1, lambda i: ("POST", "/api/vocabulary/import", {"params": {"user_id": scratch}, "content": csv_body(i)})),
+    ] + ([("GET /metrics", 1, lambda i: ("GET", "/metrics", {}))] if config.METRICS_ENABLED else [])
+
+async def load(http, factory, requests, concurrency, etags):
+    latencies, errors = [], 0
+    numbers = iter(range(requests))
+
+    async def client():
+        nonlocal errors
+        for i in numbers:
+            method, url, kwargs = factory(i)
+            if "etag" in kwargs:
+                kwargs = dict(kwargs, headers={"If-None-Match": etags[kwargs.pop("etag")]})
+            start = time.perf_counter()
+            response = await http.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code >= 400
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+async def run(requests=500, concurrency=16):
+    from api_app import app # imported here so DATABASE_URL from the command line is already in place
+
+    init_db()
+    with session_scope() as session:
+        users = session.scalar(select(func.max(User.id))) or 0
+        rows = session.scalar(select(func.count(Vocabulary.id))) or 0
+    if not users:
+        raise SystemExit("No users; fill the database with python -m bench.datagen first")
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+            etags = {1: (await http.get("/api/vocabulary", params={"user_id": 1})).headers["ETag"]}
+            for name, share, factory in scenarios(users):
+                results[name] = await load(http, factory, max(1, int(requests * share)), concurrency, etags)
+    with session_scope() as session:
+        session.execute(delete(Vocabulary).where(Vocabulary.user_id > users))
+    return {
+        "environment": environment(),
+        "dataset": {"users": users, "rows": rows},
+        "concurrency": concurrency,
+        "metrics_enabled": config.METRICS_ENABLED,
+        "benchmarks": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--output", "-o", help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+    write(asyncio.run(run(args.requests, args.concurrency)), args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Login throughput at different bcrypt work factors.
+
+    DATABASE_URL=sqlite:////tmp/auth_bench.db python -m bench.auth_bench --rounds 10 11 12 --threads 4 --logins 40
+
+For each work factor a user is created with a hash of that cost, then --logins logins are run from --threads
+threads through auth.verify_login (the hashing pool, without the attempt limits). Prints (or writes) latency
+percentiles, logins per second and logins per second per core as JSON that bench.compare can diff. Writes users
+to DATABASE_URL.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from auth import verify_login, get_hash_pool
+from bench.report import environment, summarize, write
+from database import init_db, session_scope, User
+from utils import hash_password
+
+def make_user(username, password, rounds):
+    with session_scope() as session:
+        session.query(User).filter_by(username=username).delete()
+        session.add(User(username=username, password=hash_password(password, rounds), newLang="Spanish"))
+
+def bench_rounds(rounds, threads, logins):
+    # Configure the cost under test too, so verify_login never stops to rehash
+    config.BCRYPT_ROUNDS = rounds
+    username, password = f"bench-auth-{rounds}", "correct horse battery staple"
+    make_user(username, password, rounds)
+    latencies = []
+
+    def login(_):
+        start = time.perf_counter()
+        assert verify_login(username, password)
+        latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(login, range(logins)))
+    return latencies, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 12])
+    parser.add_argument("--threads", type=int, default=4, help="concurrent logins")
+    parser.add_argument("--logins", type=int, default=20, help="logins per work factor")
+    parser.add_argument("--output", "-o", help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+
+    init_db()
+    get_hash_pool()
+    cores = os.cpu_count() or 1
+    results = {}
+    for rounds in args.rounds:
+        latencies, elapsed = bench_rounds(rounds, args.threads, args.logins)
+        result = summarize(latencies, elapsed=elapsed)
+        result["ops_per_s_per_core"] = round(result["ops_per_s"] / cores, 2)
+        results[f"verify_login [rounds={rounds}]"] = result
+    write({"environment": environment(), "threads": args.threads, "benchmarks": results}, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Compare two benchmark results written by python -m bench or any of the bench.* scripts.
+
+    python -m bench.compare base.json new.json --metric p50_ms --threshold 10
+
+Prints every benchmark found in both files with its change in percent and exits with status 1 if any of them
+got slower by more than --threshold percent, so it can gate a CI job.
+"""
+import argparse
+import json
+import sys
+
+HIGHER_IS_BETTER = {"ops_per_s", "ops_per_s_per_core"}
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def compare(base, new, metric="p50_ms"):
+    """(name, base value, new value, % slower) for benchmarks in both results; positive means a regression."""
+    rows = []
+    for name, result in new["benchmarks"].items():
+        before = base["benchmarks"].get(name, {}).get(metric)
+        after = result.get(metric)
+        if not before or after is None:
+            continue
+        change = (after - before) / before * 100
+        rows.append((name, before, after, -change if metric in HIGHER_IS_BETTER else change))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--metric", default="p50_ms", help="p50_ms, p95_ms, mean_ms, ops_per_s, ...")
+    parser.add_argument("--threshold", type=float, default=10, help="percent slower that counts as a regression")
+    args = parser.parse_args()
+
+    base, new = load(args.base), load(args.new)
+    print(f"{(base['environment'].get('commit') or '?')[:10]} -> {(new['environment'].get('commit') or '?')[:10]}  ({args.metric})")
+    regressions = 0
+    for name, before, after, slower in compare(base, new, args.metric):
+        flag = ""
+        if slower > args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{name:55} {before:12.3f} {after:12.3f} {slower:+8.1f}%{flag}")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
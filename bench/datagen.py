@@ -0,0 +1,132 @@
+"""
+Seeded synthetic dataset for the benchmarks.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m bench.datagen --users 100000 --rows 10000000 --seed 1
+
+Words per user follow a log-normal distribution, so most users have a few dozen words and a few have
+thousands. Words come from a pseudo-word lexicon with Zipf-like popularity, so common words are shared by many
+users. Each user stars a share of their words drawn from a beta distribution around --starred. Users are
+numbered from the heaviest down: user 1 has the most words and the last user the fewest. Every password is
+PASSWORD. The same seed and sizes always give the same database. It must start out empty.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+
+from sqlalchemy import func, insert
+
+from database import User, Vocabulary, init_db, session_scope, bulk_load_vocabulary_rows
+from utils import hash_password
+
+PASSWORD = "bench-password"
+SYLLABLES = [c + v for c in ("", "b", "c", "ch", "d", "f", "g", "j", "l", "ll", "m", "n", "ñ", "p", "qu", "r", "rr", "s", "t", "v", "z")
+             for v in ("a", "e", "i", "o", "u", "á", "é", "ó")]
+
+def username(n):
+    return f"user{n:06d}"
+
+def make_lexicon(rng, size):
+    """size distinct pseudo-words of two to four syllables, most popular first."""
+    words, seen = [], set()
+    while len(words) < size:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.choice((2, 2, 3, 3, 3, 4))))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+def words_per_user(rng, users, rows, max_words):
+    """Log-normal word counts summing to rows (as far as max_words allows), largest first."""
+    weights = [rng.lognormvariate(0, 1.3) for _ in range(users)]
+    scale = rows / sum(weights)
+    counts = sorted((min(max_words, max(1, int(weight * scale))) for weight in weights), reverse=True)
+    # Rounding and the cap leave the total short; spread the rest over everyone with room, heaviest first
+    missing = rows - sum(counts)
+    while missing > 0:
+        room = [i for i, count in enumerate(counts) if count < max_words]
+        if not room:
+            break
+        share = max(1, missing // len(room))
+        for i in room:
+            add = min(share, max_words - counts[i], missing)
+            counts[i] += add
+            missing -= add
+            if not missing:
+                break
+    return counts
+
+def pick_words(rng, lexicon, count):
+    if count * 4 > len(lexicon):
+        return rng.sample(lexicon, count)
+    picked = {} # a dict keeps draw order, so the result doesn't depend on string hashing
+    while len(picked) < count:
+        # Log-uniform ranks: word k is drawn about 1/k as often as the most popular word
+        picked[lexicon[int(len(lexicon) ** rng.random()) - 1]] = None
+    return list(picked)
+
+def generate(users, rows, seed=1, starred=0.15, lexicon_size=200_000, max_words=20_000, batch_rows=50_000, progress=None):
+    """Fill the (empty) database. Returns a summary of what was written."""
+    started = time.perf_counter()
+    init_db()
+    with session_scope() as session:
+        if session.query(func.count(User.id)).scalar() or session.query(func.count(Vocabulary.id)).scalar():
+            raise ValueError("bench.datagen needs an empty database")
+    rng = random.Random(seed)
+    lexicon = make_lexicon(rng, lexicon_size)
+    counts = words_per_user(rng, users, rows, min(max_words, lexicon_size))
+
+    hashed = hash_password(PASSWORD) # one hash shared by every user, hashing 100k passwords would take hours
+    for start in range(0, users, 10_000):
+        with session_scope() as session:
+            session.execute(insert(User), [
+                {"id": n, "username": username(n), "password": hashed, "nativeLang": "English", "newLang": "Spanish", "proficiency": "Beginner"}
+                for n in range(start + 1, min(users, start + 10_000) + 1)
+            ])
+
+    batch, written, starred_rows = [], 0, 0
+    beta = 2 * (1 - starred) / starred # beta(2, beta) has mean `starred`
+    for user_id, count in enumerate(counts, start=1):
+        share = rng.betavariate(2, beta)
+        for word in pick_words(rng, lexicon, count):
+            is_starred = rng.random() < share
+            starred_rows += is_starred
+            batch.append((user_id, word, is_starred))
+        if len(batch) >= batch_rows or user_id == users:
+            with session_scope() as session:
+                written += bulk_load_vocabulary_rows(session, batch)
+            batch = []
+            if progress:
+                progress(user_id, written)
+    return {
+        "users": users,
+        "rows": written,
+        "starred_rows": starred_rows,
+        "seed": seed,
+        "lexicon_size": lexicon_size,
+        "max_words_per_user": counts[0] if counts else 0,
+        "median_words_per_user": statistics.median(counts) if counts else 0,
+        "elapsed_s": round(time.perf_counter() - started, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--rows", type=int, default=10_000_000, help="vocabulary rows in total")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--starred", type=float, default=0.15, help="average share of a user's words that are starred")
+    parser.add_argument("--lexicon-size", type=int, default=200_000)
+    parser.add_argument("--max-words", type=int, default=20_000, help="cap on one user's words")
+    args = parser.parse_args()
+
+    def progress(user_id, written):
+        print(f"\r{user_id}/{args.users} users, {written} rows", end="", file=sys.stderr, flush=True)
+
+    summary = generate(args.users, args.rows, args.seed, args.starred, args.lexicon_size, args.max_words, progress=progress)
+    print(file=sys.stderr)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Offline load test of the quiz and revise flows through the LLM gateway, using the stub backend.
+
+    python -m bench.llm_flows --users 32 --rounds 5 --latency 0.5 --token-delay 0.02 --paragraphs 6
+
+Each simulated user asks for a quiz question, streams feedback on an answer and has a text of --paragraphs
+paragraphs reviewed, like one pass through the "Quiz me" and "Revise my writing" pages. A share of the users repeat
+the same inputs so singleflight and the cache get exercised. Prints (or writes) the time to first token and total
+latency of each kind of call and of a whole review, as JSON that bench.compare can diff.
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.report import environment, summarize, write
+from llm import LLMGateway, StubBackend
+from llm_cache import LLMCache
+from metrics import LLM_CALLS
+from writing_review import WritingReviewer, split_into_chunks
+
+def make_essay(word, paragraphs):
+    return "\n\n".join(" ".join(f"Hoy aprendí {word} en la frase {i}." for i in range(12)) + f" Párrafo {p}."
+                         for p in range(paragraphs))
+
+def user_session(gateway, reviewer, user, rounds, shared, paragraphs, revise_times):
+    for round_ in range(rounds):
+        # Shared users ask about the same words as everyone else in their round
+        word = f"palabra-{round_}" if user < shared else f"palabra-{user}-{round_}"
+        question = gateway.complete("quiz_question", {"word": word, "language": "Spanish"})
+        answer = f"Uso {word} en una frase."
+        "".join(gateway.stream("quiz_feedback", {"question": question, "response": answer, "word": word}))
+        start = time.perf_counter()
+        for _ in reviewer.review(split_into_chunks(make_essay(word, paragraphs))):
+            pass
+        revise_times.append(time.perf_counter() - start)
+
+def run(users, rounds, latency, token_delay, tokens, max_concurrency, shared, paragraphs, cache=False):
+    backend = StubBackend(latency=latency, token_delay=token_delay, tokens=tokens)
+    gateway = LLMGateway(backend=backend, max_concurrency=max_concurrency, cache=LLMCache(enabled=cache))
+    reviewer = WritingReviewer(gateway)
+    revise_times = []
+    LLM_CALLS.clear()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        for future in [executor.submit(user_session, gateway, reviewer, user, rounds, shared, paragraphs, revise_times) for user in range(users)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+    # LLM_CALLS only keeps the last 500 calls, so big runs are summarized from their tail
+    calls = list(LLM_CALLS)
+    benchmarks = {"revise": summarize(revise_times, elapsed=elapsed)}
+    for name in sorted({call["name"] for call in calls}):
+        matching = [call for call in calls if call["name"] == name]
+        benchmarks[f"{name} ttft"] = summarize([call["ttft"] for call in matching], elapsed=elapsed)
+        benchmarks[f"{name} total"] = summarize([call["total"] for call in matching], elapsed=elapsed)
+    benchmarks["all calls ttft"] = summarize([call["ttft"] for call in calls], elapsed=elapsed)
+    return {
+        "environment": environment(),
+        "users": users,
+        "rounds": rounds,
+        "max_concurrency": max_concurrency,
+        "duration_s": round(elapsed, 3),
+        "benchmarks": benchmarks,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.5, help="stub seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="stub seconds between tokens")
+    parser.add_argument("--tokens", type=int, default=60, help="stub tokens per response")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="gateway limit on requests in flight")
+    parser.add_argument("--shared", type=int, default=4, help="users that send identical requests")
+    parser.add_argument("--paragraphs", type=int, default=3, help="paragraphs in each text sent for review")
+    parser.add_argument("--cache", action="store_true", help="use the persistent response cache (writes to DATABASE_URL)")
+    parser.add_argument("--output", "-o", help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+    write(run(args.users, args.rounds, args.latency, args.token_delay, args.tokens,
+              args.max_concurrency, args.shared, args.paragraphs, args.cache), args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Micro-benchmarks for the database and auth helpers, against a dataset made by bench.datagen.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m bench.micro --repeat 50 --output micro.json
+
+Reads are timed for the heaviest user (user 1) and the median one. toggle_star_word runs an even number of times,
+so it leaves the word as it found it. Imports go to fresh user ids past the last generated user and are deleted
+again afterwards, which adds entries to the change log. Prints (or writes) the results as JSON.
+"""
+import argparse
+import time
+
+from sqlalchemy import delete, func, select
+
+from auth import authenticate_user, get_hash_pool
+from bench.datagen import PASSWORD, username
+from bench.report import environment, summarize, write
+from database import User, Vocabulary, init_db, session_scope, get_user_vocabulary, get_starred_words, toggle_star_word
+from vocab_io import import_stream
+
+def timed(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return summarize(times)
+
+def import_body(rows, offset):
+    return ("word,starred\n" + "".join(f"import-{offset}-{i},{i % 7 == 0:d}\n" for i in range(rows))).encode()
+
+def run(repeat=50, auth_repeat=10, import_repeat=5, import_rows=10_000):
+    init_db()
+    with session_scope() as session:
+        users = session.scalar(select(func.max(User.id))) or 0
+        rows = session.scalar(select(func.count(Vocabulary.id))) or 0
+    if not users:
+        raise SystemExit("No users; fill the database with python -m bench.datagen first")
+    profiles = {"heavy": 1, "median": max(1, users // 2)}
+    results = {}
+
+    for profile, user_id in profiles.items():
+        results[f"get_user_vocabulary[{profile}]"] = timed(lambda: get_user_vocabulary(user_id), repeat)
+        results[f"get_user_vocabulary_starred[{profile}]"] = timed(lambda: get_user_vocabulary(user_id, True), repeat)
+        results[f"get_starred_words[{profile}]"] = timed(lambda: get_starred_words(user_id), repeat)
+
+    with session_scope() as session:
+        word_id = session.scalar(select(Vocabulary.id).where(Vocabulary.user_id == profiles["median"]).limit(1))
+    results["toggle_star_word"] = timed(lambda: toggle_star_word(word_id, profiles["median"]), repeat + repeat % 2, warmup=2)
+
+    # Different users each time so the per-user attempt limit never kicks in
+    get_hash_pool()
+    logins = iter(range(1, users + 1))
+
+    def login():
+        if not authenticate_user(username(next(logins)), PASSWORD):
+            raise RuntimeError("bench login failed, was the database made by bench.datagen?")
+    results["authenticate_user"] = timed(login, auth_repeat)
+
+    importers = iter(range(users + 1, users + 2 + import_repeat))
+
+    def import_next():
+        user_id = next(importers)
+        import_stream(user_id, [import_body(import_rows, user_id)])
+    results[f"import_stream[{import_rows} rows]"] = timed(import_next, import_repeat)
+    with session_scope() as session:
+        session.execute(delete(Vocabulary).where(Vocabulary.user_id > users))
+
+    return {"environment": environment(), "dataset": {"users": users, "rows": rows}, "benchmarks": results}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=50, help="timed runs of each read and write helper")
+    parser.add_argument("--auth-repeat", type=int, default=10, help="timed logins (bcrypt makes each one slow)")
+    parser.add_argument("--import-repeat", type=int, default=5)
+    parser.add_argument("--import-rows", type=int, default=10_000)
+    parser.add_argument("--output", "-o", help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+    write(run(args.repeat, args.auth_repeat, args.import_repeat, args.import_rows), args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Shared helpers for benchmark results: latency summaries and the run metadata stored next to them."""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import config
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def summarize(times, errors=0, elapsed=None):
+    """Latency figures in milliseconds for a list of durations in seconds. Throughput uses elapsed if given."""
+    total = elapsed if elapsed is not None else sum(times)
+    return {
+        "n": len(times),
+        "errors": errors,
+        "mean_ms": round(sum(times) / len(times) * 1000, 3) if times else 0.0,
+        "min_ms": round(min(times) * 1000, 3) if times else 0.0,
+        "p50_ms": round(percentile(times, 50) * 1000, 3),
+        "p95_ms": round(percentile(times, 95) * 1000, 3),
+        "p99_ms": round(percentile(times, 99) * 1000, 3),
+        "ops_per_s": round(len(times) / total, 1) if total else 0.0,
+    }
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    """What a result was measured on, so runs from different commits and machines can be told apart."""
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "database": config.DATABASE_URL,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+def write(result, output=None):
+    text = json.dumps(result, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
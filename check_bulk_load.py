@@ -0,0 +1,79 @@
+"""
+Check that a bulk load leaves the same derived data behind as inserting the words one row at a time.
+
+    python check_bulk_load.py              # 500 words
+    python check_bulk_load.py --rows 5000
+
+bulk_load_vocabulary switches the per-row insert triggers off and writes their rows itself with one
+INSERT ... SELECT each (see database.py and migration 7), so that copy has to be changed with the triggers.
+This loads the same words for two scratch users, once through each path, and compares the vocabulary rows, the
+change log, the search index and the stats counters. Everything happens in one transaction that is rolled back,
+so it can run against a live database; it holds the write lock for as long as it takes. Exits with status 1 on
+any difference.
+"""
+import argparse
+import sys
+
+from sqlalchemy import text
+
+from database import User, bulk_load_vocabulary, get_engine, get_session, has_search_index, init_db, insert_ignore_vocabulary
+
+def sample_words(count):
+    """(word, starred) rows with accents, phrases and repeats, which the load has to skip like the triggers do."""
+    words = [(f"palabra-{i}" if i % 4 else f"canción {i}", i % 3 == 0) for i in range(count)]
+    return words + words[: count // 10]
+
+def derived_data(session, user_id):
+    """Everything the insert triggers produce for a user, with the user id itself left out so two users compare."""
+    query = lambda sql: session.execute(text(sql), {"user_id": user_id}).all()
+    data = {
+        "vocabulary": sorted(query("SELECT word, starred, language, date(timestamp) FROM vocabulary WHERE user_id = :user_id")),
+        "change log": query("SELECT word, op FROM vocabulary_changes WHERE user_id = :user_id ORDER BY id"),
+        "user_stats": query("SELECT words, starred, quizzes, correct FROM user_stats WHERE user_id = :user_id"),
+        "user_daily_stats": query("SELECT day, added FROM user_daily_stats WHERE user_id = :user_id ORDER BY day"),
+    }
+    if has_search_index(session):
+        data["search index"] = sorted(query("""
+            SELECT vocabulary_fts.word, vocabulary_fts.owner = 'u' || vocabulary.user_id FROM vocabulary_fts
+            JOIN vocabulary ON vocabulary.id = vocabulary_fts.rowid WHERE vocabulary.user_id = :user_id
+        """))
+    return data
+
+def compare(rows):
+    """{what: (per-row, bulk)} for everything that differs after loading `rows` both ways. Rolls back."""
+    session = get_session()
+    try:
+        users = [User(username=f"__check_bulk_load_{name}", password="!", nativeLang="English", newLang="Spanish") for name in ("rows", "bulk")]
+        session.add_all(users)
+        session.flush()
+        per_row, bulk = (user.id for user in users)
+        # A plain executemany, so every insert trigger fires for every row
+        session.execute(insert_ignore_vocabulary(session.get_bind()), [{"user_id": per_row, "word": word, "starred": starred} for word, starred in rows])
+        bulk_load_vocabulary(session, bulk, rows)
+        expected, actual = derived_data(session, per_row), derived_data(session, bulk)
+    finally:
+        session.rollback()
+        session.close()
+    return {what: (expected[what], actual.get(what)) for what in expected if expected[what] != actual.get(what)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500, help="distinct words to load")
+    args = parser.parse_args()
+
+    init_db()
+    if get_engine().dialect.name != "sqlite":
+        print("Only SQLite has a separate bulk path, nothing to check")
+        return
+    differences = compare(sample_words(args.rows))
+    for what, (expected, actual) in differences.items():
+        print(f"{what}: per-row path gave {len(expected)} rows, bulk load {len(actual or [])}")
+        for left, right in zip(expected, actual or []):
+            if left != right:
+                print(f"    first difference: {left!r} != {right!r}")
+                break
+    print("bulk load matches the per-row triggers" if not differences else f"{len(differences)} differences")
+    sys.exit(1 if differences else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables (from .env if present) before reading any settings
+load_dotenv()
+
+# Database settings
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///users.db")
+# api_app talks to the same database through an async driver (aiosqlite for SQLite)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5")) # connections kept open in the pool
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10")) # extra connections allowed under bursts
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30")) # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800")) # seconds before a connection is replaced
+DB_ECHO = os.getenv("DB_ECHO", "0") == "1" # log every SQL statement
+
+# SQLite tuning
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")) # wait this long on a locked database
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+
+# Password hashing and login throttling (see auth.py)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12")) # work factor for new hashes; older hashes are upgraded at login
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(os.cpu_count() or 2))) # bcrypt runs at most this many at once
+AUTH_HASH_MAX_PENDING = int(os.getenv("AUTH_HASH_MAX_PENDING", "32")) # queued + running hashes before logins are turned away
+AUTH_ATTEMPT_WINDOW = int(os.getenv("AUTH_ATTEMPT_WINDOW", "300")) # seconds over which attempts are counted
+AUTH_MAX_ATTEMPTS_PER_USER = int(os.getenv("AUTH_MAX_ATTEMPTS_PER_USER", "10"))
+AUTH_MAX_ATTEMPTS_PER_IP = int(os.getenv("AUTH_MAX_ATTEMPTS_PER_IP", "30"))
+
+# Vocabulary sync with the browser extension API
+VOCAB_API_URL = os.getenv("VOCAB_API_URL", "http://localhost:8000")
+SYNC_POLL_INTERVAL = float(os.getenv("SYNC_POLL_INTERVAL", "5")) # seconds between outbox checks when nobody wakes the worker
+SYNC_BATCH_SIZE = int(os.getenv("SYNC_BATCH_SIZE", "500")) # outbox rows sent per round
+SYNC_HTTP_POOL_SIZE = int(os.getenv("SYNC_HTTP_POOL_SIZE", "4")) # keep-alive connections to the API
+SYNC_CONNECT_TIMEOUT = float(os.getenv("SYNC_CONNECT_TIMEOUT", "2"))
+SYNC_READ_TIMEOUT = float(os.getenv("SYNC_READ_TIMEOUT", "5"))
+SYNC_BACKOFF_BASE = float(os.getenv("SYNC_BACKOFF_BASE", "2")) # seconds before the first retry, doubled each failure
+SYNC_BACKOFF_MAX = float(os.getenv("SYNC_BACKOFF_MAX", "300"))
+VOCAB_EVENTS_POLL_INTERVAL = float(os.getenv("VOCAB_EVENTS_POLL_INTERVAL", "1")) # how often api_app checks the change log for writes it didn't make itself
+VOCAB_EVENTS_HEARTBEAT = float(os.getenv("VOCAB_EVENTS_HEARTBEAT", "15")) # seconds between keep-alive comments on an idle event stream
+SYNC_EVENTS_REFRESH_INTERVAL = float(os.getenv("SYNC_EVENTS_REFRESH_INTERVAL", "2")) # how often an open vocabulary page checks for pushed changes (no network)
+VOCAB_SNAPSHOT_FP_RATE = float(os.getenv("VOCAB_SNAPSHOT_FP_RATE", "0.01")) # default false-positive rate of GET /api/vocabulary/snapshot
+
+# In-memory word lists served by api_app (see word_cache.py)
+VOCAB_CACHE_MAX_BYTES = int(os.getenv("VOCAB_CACHE_MAX_BYTES", str(64 * 1024 * 1024))) # per process, 0 turns the cache off
+VOCAB_CACHE_MAX_DELTA = int(os.getenv("VOCAB_CACHE_MAX_DELTA", "1000")) # changes applied to a cached list before it is reloaded instead
+
+# Bulk export and import (see vocab_io.py)
+VOCAB_IO_BATCH_SIZE = int(os.getenv("VOCAB_IO_BATCH_SIZE", "5000")) # rows per read batch and per import transaction
+
+# Streamlit pages
+VOCAB_PAGE_SIZE = int(os.getenv("VOCAB_PAGE_SIZE", "25")) # words shown per page of "My Vocabulary List"
+SHOW_PERF_PANEL = os.getenv("SHOW_PERF_PANEL", os.getenv("SHOW_QUERY_COUNT", "0")) == "1" # per-rerun timings, queries and LLM calls in the sidebar
+
+# Performance instrumentation (see metrics.py)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1" # request/rerun/query/LLM histograms, served at /metrics
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464")) # where the Streamlit process serves /metrics (api_app uses its own port), 0 for none
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100")) # statements slower than this are logged
+QUERY_COUNT_WARN = int(os.getenv("QUERY_COUNT_WARN", "50")) # requests or reruns running this many statements are logged as likely N+1
+
+# LLM gateway (see llm.py)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai") # "openai", or "stub" for offline load tests
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60")) # seconds per request attempt
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2")) # retries on connection errors, 429s and 5xx
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16")) # requests in flight at once across the process
+LLM_STUB_LATENCY = float(os.getenv("LLM_STUB_LATENCY", "0.5")) # stub backend: seconds before the first token
+LLM_STUB_TOKEN_DELAY = float(os.getenv("LLM_STUB_TOKEN_DELAY", "0.02")) # stub backend: seconds between tokens
+LLM_STUB_TOKENS = int(os.getenv("LLM_STUB_TOKENS", "60")) # stub backend: tokens per response
+
+# LLM response cache (see llm_cache.py)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600))) # seconds a cached response stays valid
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000")) # least recently used entries beyond this are evicted
+LLM_CACHE_QUESTION_VARIANTS = int(os.getenv("LLM_CACHE_QUESTION_VARIANTS", "3")) # distinct quiz questions kept per word and language
+
+# Pre-generated quiz questions (see quiz_pool.py)
+QUIZ_POOL_SIZE = int(os.getenv("QUIZ_POOL_SIZE", "3")) # ready questions kept per (user, word, language)
+QUIZ_POOL_WORKERS = int(os.getenv("QUIZ_POOL_WORKERS", "4")) # concurrent background LLM calls
+QUIZ_POOL_USER_MAX_PENDING = int(os.getenv("QUIZ_POOL_USER_MAX_PENDING", "20")) # queued warm-ups per user
+QUIZ_POOL_USER_HOURLY_QUOTA = int(os.getenv("QUIZ_POOL_USER_HOURLY_QUOTA", "200")) # background generations per user per hour
+
+# Translations, definitions and examples for saved words (see enrichment.py)
+ENRICHMENT_ENABLED = os.getenv("ENRICHMENT_ENABLED", "1") == "1"
+ENRICHMENT_BATCH_SIZE = int(os.getenv("ENRICHMENT_BATCH_SIZE", "40")) # words per LLM call
+ENRICHMENT_SCAN_SIZE = int(os.getenv("ENRICHMENT_SCAN_SIZE", "2000")) # vocabulary rows checked per step of the background scan
+ENRICHMENT_IDLE_INTERVAL = float(os.getenv("ENRICHMENT_IDLE_INTERVAL", "60")) # seconds between scans for new words once caught up
+ENRICHMENT_RESCAN_INTERVAL = float(os.getenv("ENRICHMENT_RESCAN_INTERVAL", "3600")) # seconds between passes over the whole table
+ENRICHMENT_RETRY_DELAY = float(os.getenv("ENRICHMENT_RETRY_DELAY", "30")) # seconds to wait after a failed call
+ENRICHMENT_MISSING_RETRY_DAYS = float(os.getenv("ENRICHMENT_MISSING_RETRY_DAYS", "7")) # before asking again about a word the model left out
+
+# Revise my writing (see writing_review.py)
+WRITING_CHUNK_CHARS = int(os.getenv("WRITING_CHUNK_CHARS", "1200")) # target size of a chunk of paragraphs
+WRITING_MAX_CHUNKS = int(os.getenv("WRITING_MAX_CHUNKS", "4")) # chunks grow past WRITING_CHUNK_CHARS to stay within this
+WRITING_REVIEW_WORKERS = int(os.getenv("WRITING_REVIEW_WORKERS", "12")) # concurrent review calls (aspects x chunks)
@@ -1,20 +1,131 @@
 # sqlalchemy: library to interact with databases in python
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import create_engine, event, func, select, delete, text, tuple_, or_, Column, Integer, Float, String, Text, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime
-import requests
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from collections import namedtuple
+from contextlib import contextmanager, asynccontextmanager
+from datetime import datetime, timedelta
+import threading
+import config
+import migrations
+import metrics
+from srs import DEFAULT_EASE, schedule_review, next_due
 
 Base = declarative_base() #This variable is the base for defining all database models
 
 # Database setup
-def get_engine(): # a function that creates a connection to a database
-    return create_engine("sqlite:///users.db") 
+_engine = None
+_Session = None
+_async_engine = None
+_AsyncSession = None
+_engine_lock = threading.Lock()
 
-def get_session(): #creates a session object. Sessions handle queries and updates
-    engine = get_engine()
-    Session = sessionmaker(bind=engine)
-    return Session()
+def _is_memory_db(url):
+    return url.startswith("sqlite") and (url.endswith(":memory:") or url in ("sqlite://", "sqlite:///"))
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # Runs once for every new pooled connection. WAL lets readers and a writer work at the same time,
+    # NORMAL is safe with WAL and avoids an fsync per commit, and busy_timeout waits instead of failing on a lock.
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+def _engine_kwargs(url):
+    # SQLite files can't drop a connection like a network server can, so only ping other databases on checkout
+    kwargs = {"echo": config.DB_ECHO, "pool_pre_ping": not url.startswith("sqlite")}
+    if url.startswith("sqlite"):
+        # Streamlit reruns and FastAPI's threadpool use connections from different threads
+        kwargs["connect_args"] = {"check_same_thread": False}
+    if not _is_memory_db(url):
+        kwargs.update(
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+        )
+    return kwargs
+
+def _instrument(engine):
+    # Query timing costs two events per statement, so it is only hooked up when someone looks at the numbers
+    if config.METRICS_ENABLED or config.SHOW_PERF_PANEL:
+        event.listen(engine, "before_cursor_execute", metrics.before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", metrics.after_cursor_execute)
+
+def get_engine(): # returns the one engine shared by the whole process
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                url = config.DATABASE_URL
+                engine = create_engine(url, **_engine_kwargs(url))
+                if url.startswith("sqlite"):
+                    event.listen(engine, "connect", _set_sqlite_pragmas)
+                _instrument(engine)
+                _engine = engine
+    return _engine
+
+def get_async_engine(): # the async counterpart used by api_app, also one per process
+    global _async_engine
+    if _async_engine is None:
+        with _engine_lock:
+            if _async_engine is None:
+                url = config.ASYNC_DATABASE_URL
+                engine = create_async_engine(url, **_engine_kwargs(url))
+                if url.startswith("sqlite"):
+                    event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+                _instrument(engine.sync_engine)
+                _async_engine = engine
+    return _async_engine
+
+def get_session(): #creates a session object. Sessions handle queries and updates. Callers must close it.
+    global _Session
+    if _Session is None:
+        # expire_on_commit=False keeps loaded objects readable after the session is closed
+        _Session = sessionmaker(bind=get_engine(), expire_on_commit=False)
+    return _Session()
+
+@contextmanager
+def session_scope():
+    """
+    Provide a transactional scope around a series of operations.
+    Commits on success, rolls back on error and always returns the connection to the pool.
+    """
+    session = get_session()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def get_async_session(): # callers must close it, or use async_session_scope()
+    global _AsyncSession
+    if _AsyncSession is None:
+        _AsyncSession = async_sessionmaker(bind=get_async_engine(), expire_on_commit=False)
+    return _AsyncSession()
+
+@asynccontextmanager
+async def async_session_scope():
+    """Async version of session_scope(): commit on success, roll back on error, always close."""
+    session = get_async_session()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+async def get_async_db():
+    """FastAPI dependency yielding an AsyncSession that is released when the request finishes."""
+    async with async_session_scope() as session:
+        yield session
 
 # User model
 class User(Base): #defines a database table 
@@ -35,77 +146,688 @@ class Vocabulary(Base):
     user_id = Column(Integer, ForeignKey('users.id'))
     user = relationship("User", back_populates="vocabulary")
     timestamp = Column(DateTime, default=datetime.utcnow)
+    # The language the word was saved in: the owner's newLang at the time, filled in by a trigger (see migrations)
+    language = Column(String, nullable=True)
+    # Spaced repetition state (see srs.py). due_at is NULL until the first review, which sorts first: new words are due now.
+    ease = Column(Float, nullable=False, default=DEFAULT_EASE, server_default=str(DEFAULT_EASE))
+    interval = Column(Integer, nullable=False, default=0, server_default="0") # days
+    repetitions = Column(Integer, nullable=False, default=0, server_default="0") # successful reviews in a row
+    reviews = Column(Integer, nullable=False, default=0, server_default="0") # total reviews
+    due_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # One row per word per user; also serves the (user_id, word) dedupe lookups
+        Index("uq_vocabulary_user_word", "user_id", "word", unique=True),
+        # Newest-first listing of a user's words, with and without the starred filter
+        Index("ix_vocabulary_user_timestamp", "user_id", "timestamp"),
+        Index("ix_vocabulary_user_starred_timestamp", "user_id", "starred", "timestamp"),
+        # Quiz queue: the user's starred word that is due soonest is the first entry of this index
+        Index("ix_vocabulary_user_starred_due", "user_id", "starred", "due_at"),
+    )
+
+class VocabularyChange(Base):
+    """
+    Append-only change log of vocabulary adds and deletes, filled by triggers on the vocabulary table
+    (see migrations.py). The id is the sync cursor, so it must only ever grow. Deletes stay in the log as tombstones.
+    """
+    __tablename__ = 'vocabulary_changes'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=True)
+    word = Column(String, nullable=False)
+    op = Column(String, nullable=False) # 'add' or 'delete'
+    timestamp = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_vocabulary_changes_user_id", "user_id", "id"),
+        {"sqlite_autoincrement": True}, # never reuse ids, even after the newest rows are removed
+    )
+
+class ExtensionSyncState(Base):
+    """Last change-log cursor each user has imported from the browser extension API."""
+    __tablename__ = 'extension_sync_state'
+    user_id = Column(Integer, primary_key=True)
+    cursor = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SyncOutbox(Base):
+    """
+    Durable queue of vocabulary changes waiting to be pushed to the extension API by sync.OutboxWorker.
+    There is at most one row per (user_id, word): a newer op replaces an older pending one.
+    """
+    __tablename__ = 'sync_outbox'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    word = Column(String, nullable=False)
+    op = Column(String, nullable=False) # 'add' or 'delete'
+    version = Column(Integer, nullable=False, default=1) # bumped when op changes, so a stale send can't drop the row
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("uq_sync_outbox_user_word", "user_id", "word", unique=True),
+        Index("ix_sync_outbox_next_attempt_at", "next_attempt_at"),
+    )
+
+class LLMCacheEntry(Base):
+    """Cached LLM responses, see llm_cache.py. A key can hold several variants so repeated quizzes still vary."""
+    __tablename__ = 'llm_cache'
+    id = Column(Integer, primary_key=True)
+    cache_key = Column(String, nullable=False) # sha256 of model, prompt template version and normalized inputs
+    variant = Column(Integer, nullable=False, default=0)
+    model = Column(String, nullable=False)
+    template_version = Column(String, nullable=False)
+    response = Column(Text, nullable=False)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+    last_used_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("uq_llm_cache_key_variant", "cache_key", "variant", unique=True),
+        Index("ix_llm_cache_last_used_at", "last_used_at"), # LRU eviction order
+    )
+
+class QuizQuestion(Base):
+    """Ready-to-serve quiz questions generated in the background by quiz_pool.QuizQuestionPool."""
+    __tablename__ = 'quiz_questions'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    word = Column(String, nullable=False)
+    language = Column(String, nullable=False)
+    question = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_quiz_questions_user_word_language", "user_id", "word", "language", "id"),
+    )
+
+class UserStats(Base):
+    """
+    Running totals per user, so progress views read one row instead of scanning the vocabulary. Word counts are
+    kept by triggers on vocabulary (see migrations._user_stats), quiz counts by record_review.
+    """
+    __tablename__ = 'user_stats'
+    user_id = Column(Integer, primary_key=True)
+    words = Column(Integer, nullable=False, default=0, server_default="0")
+    starred = Column(Integer, nullable=False, default=0, server_default="0")
+    quizzes = Column(Integer, nullable=False, default=0, server_default="0") # graded quiz answers
+    correct = Column(Integer, nullable=False, default=0, server_default="0") # answers graded 3 or better
+
+class UserDailyStats(Base):
+    """Words added per user and UTC day that are still in the list, also kept by the vocabulary triggers."""
+    __tablename__ = 'user_daily_stats'
+    user_id = Column(Integer, primary_key=True)
+    day = Column(String, primary_key=True) # YYYY-MM-DD
+    added = Column(Integer, nullable=False, default=0, server_default="0")
+
+class VocabularyEnrichment(Base):
+    """
+    Translation, definition and example sentence for a word, filled in the background by enrichment.py.
+    One row per (word, language, native language) is shared by every user who saved the word. When the model
+    left the word out, the text columns stay NULL and retry_at says when it may be asked again.
+    """
+    __tablename__ = 'vocabulary_enrichment'
+    id = Column(Integer, primary_key=True)
+    word = Column(String, nullable=False)
+    language = Column(String, nullable=False) # the language being learned, which the word is in
+    native_language = Column(String, nullable=False) # the language of the translation and definition
+    translation = Column(String, nullable=True)
+    definition = Column(Text, nullable=True)
+    example = Column(Text, nullable=True)
+    model = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    retry_at = Column(DateTime, nullable=True) # NULL once enriched
+
+    __table_args__ = (
+        Index("uq_vocabulary_enrichment_word_language", "word", "language", "native_language", unique=True),
+    )
 
 # Initialize database
-def init_db(): #a function that creates the database table defined above
+def init_db(): #a function that creates the database tables defined above and upgrades existing ones
     engine = get_engine()
-    Base.metadata.create_all(engine)
+    Base.metadata.create_all(engine) # creates missing tables only, never touches existing data
+    migrations.run_migrations(engine) # upgrades existing tables in place
 
-def dataset_db():
-    session = get_session()
-    users = session.query(User.username, User.password).all()
-    engine = get_engine()
-    Base.metadata.drop_all(engine)  # Drop all tables
-    Base.metadata.create_all(engine)  # Recreate tables with updated schema
-    session = get_session()
-    for username, password in users:
-        user = User(username=username, password=password, nativeLang="English", newLang="Spanish", proficiency="Beginner")
-        session.add(user)
-    session.commit()
+def insert_ignore(bind, model, index_elements):
+    """
+    Build an INSERT for model that silently skips rows violating the unique index on index_elements.
+    Lets the database do the dedupe in one statement instead of a SELECT followed by an INSERT.
+    """
+    return dialect_insert(bind, model).on_conflict_do_nothing(index_elements=index_elements)
+
+def dialect_insert(bind, model):
+    """The dialect's own INSERT for model, which has the ON CONFLICT clauses the generic one lacks."""
+    if bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+def insert_ignore_vocabulary(bind):
+    return insert_ignore(bind, Vocabulary, ["user_id", "word"])
+
+def insert_vocabulary_word(user_id, word, starred=False, sync=False):
+    """
+    Add a word to the user's vocabulary. Returns False if the user already has it.
+    With sync=True the word is also queued for the extension API in the same transaction.
+    """
+    with session_scope() as session:
+        result = session.execute(
+            insert_ignore_vocabulary(session.get_bind()).values(user_id=user_id, word=word, starred=starred)
+        )
+        added = result.rowcount == 1
+        if added and sync:
+            enqueue_sync(session, user_id, word, "add")
+        return added
+
+def enqueue_sync(session, user_id, word, op):
+    """
+    Queue an 'add' or 'delete' for the extension API using the given session.
+    Pending ops for the same word are coalesced: the newest op wins, so add+delete collapses into one request.
+    """
+    pending = session.query(SyncOutbox).filter_by(user_id=user_id, word=word).first()
+    if pending is None:
+        session.add(SyncOutbox(user_id=user_id, word=word, op=op))
+    elif pending.op != op:
+        pending.op = op
+        pending.version += 1
+        pending.attempts = 0
+        pending.next_attempt_at = datetime.utcnow()
+
+def get_due_sync_ops(limit):
+    """Outbox rows whose next attempt is due, oldest first, as plain tuples."""
+    with session_scope() as session:
+        return session.query(
+            SyncOutbox.id, SyncOutbox.version, SyncOutbox.user_id, SyncOutbox.word, SyncOutbox.op, SyncOutbox.attempts
+        ).filter(SyncOutbox.next_attempt_at <= datetime.utcnow()).order_by(SyncOutbox.id).limit(limit).all()
+
+def complete_sync_ops(ops):
+    """Remove delivered rows, unless their op changed while the request was in flight."""
+    with session_scope() as session:
+        for op in ops:
+            session.query(SyncOutbox).filter_by(id=op.id, version=op.version).delete(synchronize_session=False)
+
+def retry_sync_ops(ops, delays, error):
+    """Push failed rows back with their next attempt time. delays is one delay in seconds per op."""
+    now = datetime.utcnow()
+    with session_scope() as session:
+        for op, delay in zip(ops, delays):
+            session.query(SyncOutbox).filter_by(id=op.id, version=op.version).update({
+                SyncOutbox.attempts: SyncOutbox.attempts + 1,
+                SyncOutbox.next_attempt_at: now + timedelta(seconds=delay),
+                SyncOutbox.last_error: error[:500],
+            }, synchronize_session=False)
+
+# SQLite caps the number of bound parameters per statement, so large IN lists are split
+MAX_IN_PARAMS = 500
+
+def _clean_words(words):
+    """Drop non-strings, blanks and repeats while keeping the incoming order."""
+    seen = set()
+    cleaned = []
+    for word in words:
+        if isinstance(word, str) and word.strip() and word not in seen:
+            seen.add(word)
+            cleaned.append(word)
+    return cleaned
+
+def bulk_insert_vocabulary(session, user_id, words):
+    """
+    Insert every word the user doesn't have yet using the given session.
+    Existing words are found with one set-based query (chunked only to respect the parameter limit)
+    and the new rows go in as a single batched INSERT. Returns the list of words that were added.
+    """
+    words = _clean_words(words)
+    if not words:
+        return []
+    existing = set()
+    for start in range(0, len(words), MAX_IN_PARAMS):
+        chunk = words[start:start + MAX_IN_PARAMS]
+        rows = session.query(Vocabulary.word).filter(Vocabulary.user_id == user_id, Vocabulary.word.in_(chunk))
+        existing.update(word for (word,) in rows)
+    new_words = [word for word in words if word not in existing]
+    if new_words:
+        # ON CONFLICT still guards against a concurrent insert of the same word
+        session.execute(
+            insert_ignore_vocabulary(session.get_bind()),
+            [{"user_id": user_id, "word": word, "starred": False} for word in new_words],
+        )
+    return new_words
+
+# Per-row triggers that bulk_load_vocabulary switches off and replaces with one set-based statement each.
+# Change those statements with the triggers; check_bulk_load.py compares what the two paths leave behind.
+_BULK_LOAD_TRIGGERS = ("trg_vocabulary_log_insert", "trg_vocabulary_fts_insert", "trg_vocabulary_stats_insert")
+
+def bulk_load_vocabulary(session, user_id, rows):
+    """
+    Insert (word, starred) rows the user doesn't have yet, for large imports. Returns how many were added.
+
+    On SQLite the change-log, search-index and stats insert triggers are switched off for the statement by a row
+    in vocabulary_bulk_load, and their rows are written with one INSERT ... SELECT each, which is several times
+    faster than firing them per row. The guard row is deleted before the transaction commits, so other connections
+    never see it. Other databases get a plain INSERT ... ON CONFLICT DO NOTHING.
+    """
+    return bulk_load_vocabulary_rows(session, [(user_id, word, starred) for word, starred in rows])
+
+def bulk_load_vocabulary_rows(session, rows):
+    """bulk_load_vocabulary for (user_id, word, starred) rows that may belong to many users."""
+    if not rows:
+        return 0
+    connection = session.connection()
+    if connection.dialect.name != "sqlite":
+        return connection.execute(
+            insert_ignore_vocabulary(connection),
+            [{"user_id": user_id, "word": word, "starred": starred} for user_id, word, starred in rows],
+        ).rowcount
+
+    if not connection.connection.driver_connection.in_transaction:
+        # The driver only opens a transaction by itself before DML, so another writer could get in between
+        # reading MAX(id) below and the insert. Take the write lock up front instead.
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+    # Not DROP TRIGGER: a schema change makes the next write on every other connection fail once (see migrations)
+    names = set(connection.exec_driver_sql(
+        f"SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN ({', '.join('?' * len(_BULK_LOAD_TRIGGERS))})",
+        _BULK_LOAD_TRIGGERS,
+    ).scalars())
+    first_id = connection.exec_driver_sql("SELECT COALESCE(MAX(id), 0) + 1 FROM vocabulary").scalar()
+    connection.exec_driver_sql("INSERT INTO vocabulary_bulk_load (id) VALUES (1)")
+    # Same text format SQLAlchemy's DateTime uses on SQLite
+    timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")
+    added = connection.exec_driver_sql(
+        # The language too, so trg_vocabulary_language has nothing to do
+        "INSERT INTO vocabulary (user_id, word, starred, timestamp, language) "
+        "VALUES (?, ?, ?, ?, (SELECT newLang FROM users WHERE id = ?)) ON CONFLICT (user_id, word) DO NOTHING",
+        [(user_id, word, bool(starred), timestamp, user_id) for user_id, word, starred in rows],
+    ).rowcount
+    # The write lock is held since BEGIN IMMEDIATE, so every id from first_id on was inserted just now
+    if "trg_vocabulary_log_insert" in names:
+        connection.exec_driver_sql(
+            "INSERT INTO vocabulary_changes (user_id, word, op, timestamp) "
+            "SELECT user_id, word, 'add', CURRENT_TIMESTAMP FROM vocabulary WHERE id >= ? ORDER BY id", (first_id,)
+        )
+    if "trg_vocabulary_fts_insert" in names:
+        connection.exec_driver_sql(
+            "INSERT INTO vocabulary_fts (rowid, word, owner) SELECT id, word, 'u' || user_id FROM vocabulary WHERE id >= ?", (first_id,)
+        )
+    if "trg_vocabulary_stats_insert" in names:
+        connection.exec_driver_sql(
+            "INSERT INTO user_stats (user_id, words, starred, quizzes, correct) "
+            "SELECT user_id, COUNT(*), SUM(starred), 0, 0 FROM vocabulary WHERE id >= ? AND user_id IS NOT NULL GROUP BY user_id "
+            "ON CONFLICT (user_id) DO UPDATE SET words = words + excluded.words, starred = starred + excluded.starred", (first_id,)
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO user_daily_stats (user_id, day, added) "
+            "SELECT user_id, date(timestamp), COUNT(*) FROM vocabulary WHERE id >= ? AND user_id IS NOT NULL GROUP BY user_id, date(timestamp) "
+            "ON CONFLICT (user_id, day) DO UPDATE SET added = added + excluded.added", (first_id,)
+        )
+    connection.exec_driver_sql("DELETE FROM vocabulary_bulk_load")
+    return added
+
+def bulk_delete_vocabulary(session, user_id, words):
+    """Delete the given words from the user's vocabulary using the given session. Returns how many rows were removed."""
+    words = _clean_words(words)
+    removed = 0
+    for start in range(0, len(words), MAX_IN_PARAMS):
+        chunk = words[start:start + MAX_IN_PARAMS]
+        removed += session.query(Vocabulary).filter(
+            Vocabulary.user_id == user_id, Vocabulary.word.in_(chunk)
+        ).delete(synchronize_session=False)
+    return removed
+
+def get_vocabulary_version(session, user_id):
+    """Id of the newest change for this user, or 0. Changes whenever the user's word list does."""
+    return session.query(func.max(VocabularyChange.id)).filter(VocabularyChange.user_id == user_id).scalar() or 0
+
+def get_vocabulary_changes(session, user_id, since=0, limit=1000):
+    """
+    Return (changes, cursor, has_more) for everything logged after the `since` cursor.
+    Changes are collapsed to the latest op per word within the page, in log order,
+    so a word that was added and then deleted shows up once as a delete.
+    """
+    rows = (
+        session.query(VocabularyChange.id, VocabularyChange.op, VocabularyChange.word)
+        .filter(VocabularyChange.user_id == user_id, VocabularyChange.id > since)
+        .order_by(VocabularyChange.id)
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    cursor = rows[-1].id if rows else since
+    latest = {}
+    for row in rows:
+        latest.pop(row.word, None) # re-insert so dict order follows the newest change
+        latest[row.word] = row.op
+    changes = [{"op": op, "word": word} for word, op in latest.items()]
+    return changes, cursor, has_more
+
+def get_latest_change_id(session):
+    return session.query(func.max(VocabularyChange.id)).scalar() or 0
+
+def get_sync_cursor(user_id):
+    with session_scope() as session:
+        state = session.get(ExtensionSyncState, user_id)
+        return state.cursor if state else 0
+
+def get_oldest_sync_cursor():
+    """The lowest cursor any user has imported up to, or 0. Everything after it is new to someone."""
+    with session_scope() as session:
+        return session.query(func.min(ExtensionSyncState.cursor)).scalar() or 0
+
+def apply_vocabulary_changes(user_id, added, removed, cursor):
+    """
+    Apply a delta pulled from the extension API and store the new cursor in the same transaction,
+    so a crash can never advance the cursor past changes that were not saved. Returns (added_count, removed_count).
+    """
+    with session_scope() as session:
+        added_words = bulk_insert_vocabulary(session, user_id, added)
+        removed_count = bulk_delete_vocabulary(session, user_id, removed)
+        state = session.get(ExtensionSyncState, user_id)
+        if state is None:
+            session.add(ExtensionSyncState(user_id=user_id, cursor=cursor))
+        else:
+            state.cursor = cursor
+        return len(added_words), removed_count
+
+def count_quiz_questions(user_id, word, language):
+    with session_scope() as session:
+        return session.query(func.count(QuizQuestion.id)).filter_by(user_id=user_id, word=word, language=language).scalar()
+
+def add_quiz_question(user_id, word, language, question):
+    with session_scope() as session:
+        session.add(QuizQuestion(user_id=user_id, word=word, language=language, question=question))
+
+def pop_quiz_question(user_id, word, language):
+    """Take the oldest ready question for this word and language out of the pool, or None if it is empty."""
+    oldest = select(QuizQuestion.id).filter_by(
+        user_id=user_id, word=word, language=language
+    ).order_by(QuizQuestion.id).limit(1).scalar_subquery()
+    with session_scope() as session:
+        # One DELETE ... RETURNING, so two tabs popping at once can never serve the same question
+        return session.execute(
+            delete(QuizQuestion).where(QuizQuestion.id == oldest).returning(QuizQuestion.question)
+        ).scalar()
+
+def _enrichment_done(now):
+    # Rows the model answered for, and the ones it left out that aren't due for another try yet
+    return or_(VocabularyEnrichment.retry_at.is_(None), VocabularyEnrichment.retry_at > now)
+
+def get_unenriched_words(after_id, limit):
+    """
+    Scan the next `limit` vocabulary rows after id `after_id` for words that have no enrichment yet in the
+    language they were saved in and their owner's native language. Returns the distinct (word, language, native
+    language) keys found and the last id scanned, which is None once the end of the table is reached.
+    """
+    # Rows saved before the language was recorded (or without the trigger) fall back to the owner's current one
+    language = func.coalesce(Vocabulary.language, User.newLang)
+    enriched = select(VocabularyEnrichment.id).where(
+        VocabularyEnrichment.word == Vocabulary.word,
+        VocabularyEnrichment.language == language,
+        VocabularyEnrichment.native_language == User.nativeLang,
+        _enrichment_done(datetime.utcnow()),
+    ).exists()
+    with session_scope() as session:
+        rows = session.execute(
+            select(Vocabulary.id, Vocabulary.word, language, User.nativeLang, enriched)
+            .join(User, User.id == Vocabulary.user_id)
+            .where(Vocabulary.id > after_id)
+            .order_by(Vocabulary.id)
+            .limit(limit)
+        ).all()
+    keys = {(word, language, native) for _, word, language, native, done in rows if not done and language and native}
+    return sorted(keys), rows[-1].id if rows else None
+
+def get_enrichments(words, language, native_language):
+    """
+    {word: VocabularyEnrichment} for the given words that have been enriched already, or that the model left
+    out recently (all text columns None).
+    """
+    if not words:
+        return {}
+    with session_scope() as session:
+        rows = session.query(VocabularyEnrichment).filter(
+            VocabularyEnrichment.language == language,
+            VocabularyEnrichment.native_language == native_language,
+            VocabularyEnrichment.word.in_(set(words)),
+            _enrichment_done(datetime.utcnow()),
+        ).all()
+    return {row.word: row for row in rows}
+
+def save_enrichments(language, native_language, model, entries, missing=()):
+    """
+    Store {word: (translation, definition, example)}, and mark the `missing` words the model left out to be
+    asked again after ENRICHMENT_MISSING_RETRY_DAYS. Either replaces an earlier miss; a word another process
+    enriched in the meantime keeps its row.
+    """
+    now = datetime.utcnow()
+    retry_at = now + timedelta(days=config.ENRICHMENT_MISSING_RETRY_DAYS)
+    values = [
+        {"word": word, "language": language, "native_language": native_language, "translation": translation,
+         "definition": definition, "example": example, "model": model, "created_at": now, "retry_at": None}
+        for word, (translation, definition, example) in entries.items()
+    ] + [
+        {"word": word, "language": language, "native_language": native_language, "translation": None,
+         "definition": None, "example": None, "model": model, "created_at": now, "retry_at": retry_at}
+        for word in missing if word not in entries
+    ]
+    if not values:
+        return
+    with session_scope() as session:
+        statement = dialect_insert(session.get_bind(), VocabularyEnrichment)
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=["word", "language", "native_language"],
+                set_={name: statement.excluded[name] for name in ("translation", "definition", "example", "model", "created_at", "retry_at")},
+                where=VocabularyEnrichment.retry_at.is_not(None),
+            ),
+            values,
+        )
+
+# What the app needs to know about the logged-in user. Loaded once at login and kept in the Streamlit
+# session, so pages don't look the user up by username on every rerun.
+UserContext = namedtuple("UserContext", ["id", "username", "newLang", "proficiency", "nativeLang"])
+
+def make_user_context(user):
+    return UserContext(user.id, user.username, user.newLang, user.proficiency, user.nativeLang)
+
+def get_user_context(user_id):
+    with session_scope() as session:
+        user = session.get(User, user_id)
+        return make_user_context(user) if user else None
+
+def update_user(user_id, username=None, password=None, newLang=None):
+    """Change the given fields of a user. Returns the updated UserContext, or None if there is no such user."""
+    with session_scope() as session:
+        user = session.get(User, user_id)
+        if not user:
+            return None
+        if username:
+            user.username = username
+        if password:
+            user.password = password
+        if newLang:
+            user.newLang = newLang
+        return make_user_context(user)
 
 def get_all_usernames():
-    session = get_session()
-    usernames = session.query(User.username).all()
+    with session_scope() as session:
+        usernames = session.query(User.username).all()
     return [username[0] for username in usernames]
 
 def get_all_passwords():
-    session = get_session()
-    passwords = session.query(User.password).all()
+    with session_scope() as session:
+        passwords = session.query(User.password).all()
     return [password[0] for password in passwords]
 
 
 def get_user_vocabulary(user_id, show_starred_only=False):
-    session = get_session()
-    query = session.query(Vocabulary).filter_by(user_id=user_id)
-    if show_starred_only:
-        query = query.filter_by(starred=True)
-    return query.order_by(Vocabulary.timestamp.desc()).all()
+    with session_scope() as session:
+        query = session.query(Vocabulary).filter_by(user_id=user_id)
+        if show_starred_only:
+            query = query.filter_by(starred=True)
+        return query.order_by(Vocabulary.timestamp.desc()).all()
+
+def encode_page_cursor(item):
+    """Opaque keyset cursor for the last row of a page: its timestamp and id."""
+    return f"{item.timestamp.isoformat()}|{item.id}"
+
+def decode_page_cursor(cursor):
+    """Inverse of encode_page_cursor. Raises ValueError on a malformed cursor."""
+    timestamp, _, word_id = cursor.rpartition("|")
+    return datetime.fromisoformat(timestamp), int(word_id)
+
+def query_vocabulary_page(session, user_id, limit=25, after=None, starred_only=False):
+    """
+    One page of the user's words, newest first, using the given session.
+    Keyset pagination on (timestamp, id): `after` is the cursor of the previous page's last row, so every
+    page is an index seek on (user_id[, starred], timestamp) no matter how deep it is.
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    """
+    query = session.query(Vocabulary).filter(Vocabulary.user_id == user_id)
+    if starred_only:
+        query = query.filter(Vocabulary.starred == True)
+    if after:
+        timestamp, word_id = decode_page_cursor(after)
+        query = query.filter(tuple_(Vocabulary.timestamp, Vocabulary.id) < tuple_(timestamp, word_id))
+    items = query.order_by(Vocabulary.timestamp.desc(), Vocabulary.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_page_cursor(items[limit - 1]) if len(items) > limit else None
+    return items[:limit], next_cursor
+
+def _fts_match_expression(user_id, query):
+    """Build an FTS5 MATCH string: the user's owner token AND a prefix match for every search term."""
+    terms = ['word : "' + term.replace('"', '""') + '"*' for term in query.split()]
+    return " AND ".join([f'owner : "u{int(user_id)}"'] + terms)
+
+_search_index_cache = {} # database url -> whether vocabulary_fts exists
+
+def has_search_index(session):
+    url = str(session.get_bind().url)
+    if url not in _search_index_cache:
+        _search_index_cache[url] = session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'vocabulary_fts'")
+        ).first() is not None
+    return _search_index_cache[url]
+
+def query_search_vocabulary(session, user_id, query, starred_only=False, limit=50):
+    """
+    Search the user's words with the given session. Every term is a prefix match and,
+    through the FTS5 index, case and accent insensitive, so the cost depends on the number
+    of matches rather than on the size of the vocabulary. Results are ranked by bm25.
+    """
+    query = (query or "").strip()
+    if not query:
+        return []
+    if session.get_bind().dialect.name != "sqlite" or not has_search_index(session):
+        # No FTS5 available: plain prefix match on the (user_id, word) index
+        rows = session.query(Vocabulary).filter(
+            Vocabulary.user_id == user_id, Vocabulary.word.startswith(query, autoescape=True)
+        )
+        if starred_only:
+            rows = rows.filter(Vocabulary.starred == True)
+        return rows.order_by(Vocabulary.word).limit(limit).all()
+    statement = text("""
+        SELECT vocabulary.* FROM vocabulary_fts
+        JOIN vocabulary ON vocabulary.id = vocabulary_fts.rowid
+        WHERE vocabulary_fts MATCH :match AND (:starred_only = 0 OR vocabulary.starred = 1)
+        ORDER BY vocabulary_fts.rank, vocabulary.word
+        LIMIT :limit
+    """)
+    params = {"match": _fts_match_expression(user_id, query), "starred_only": int(starred_only), "limit": limit}
+    return session.execute(select(Vocabulary).from_statement(statement), params).scalars().all()
+
+def search_vocabulary(user_id, query, starred_only=False, limit=50):
+    with session_scope() as session:
+        return query_search_vocabulary(session, user_id, query, starred_only, limit)
+
+def get_user_vocabulary_page(user_id, limit=25, after=None, starred_only=False):
+    with session_scope() as session:
+        return query_vocabulary_page(session, user_id, limit, after, starred_only)
 
 def toggle_star_word(word_id, user_id):
-    session = get_session()
-    word = session.query(Vocabulary).filter_by(id=word_id, user_id=user_id).first()
-    if word:
-        word.starred = not word.starred
-        session.commit()
-        return True
+    with session_scope() as session:
+        word = session.query(Vocabulary).filter_by(id=word_id, user_id=user_id).first()
+        if word:
+            word.starred = not word.starred
+            return True
     return False
 
 def remove_vocabulary_word(word_id: int, user_id: int) -> bool:
     """
-    Remove a word from the user's vocabulary and sync with the browser extension.
+    Remove a word from the user's vocabulary and queue the removal for the browser extension.
+    The API call itself happens in the background (see sync.py), so this never waits on the network.
     """
-    session = get_session()
-    word = session.query(Vocabulary).filter_by(id=word_id, user_id=user_id).first()
-    
-    if word:
-        word_text = word.word  # Save the word text before deleting
+    with session_scope() as session:
+        word = session.query(Vocabulary).filter_by(id=word_id, user_id=user_id).first()
+        if not word:
+            return False
+        enqueue_sync(session, user_id, word.word, "delete")
         session.delete(word)
-        session.commit()
-        
-        # Try to sync with browser extension
-        try:
-            response = requests.delete(
-                "http://localhost:8000/api/vocabulary",
-                json={"word": word_text}
-            )
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            # Silently fail if the extension is not running
-            pass
-            
-        return True
-    return False
+    return True
+
+def get_next_quiz_word(user_id):
+    """The starred word due soonest as (id, word, due_at), or None if nothing is starred. One index seek."""
+    with session_scope() as session:
+        return session.query(Vocabulary.id, Vocabulary.word, Vocabulary.due_at).filter(
+            Vocabulary.user_id == user_id, Vocabulary.starred == True
+        ).order_by(Vocabulary.due_at).limit(1).first()
+
+def record_review(word_id, user_id, quality, now=None):
+    """Grade a quiz answer (0-5) and reschedule the word. Returns when it is next due, or None if it is gone."""
+    now = now or datetime.utcnow()
+    with session_scope() as session:
+        word = session.query(Vocabulary).filter_by(id=word_id, user_id=user_id).first()
+        if not word:
+            return None
+        word.ease, word.interval, word.repetitions = schedule_review(word.ease, word.interval, word.repetitions, quality)
+        word.reviews += 1
+        word.due_at = next_due(now, word.interval)
+        correct = int(quality >= 3)
+        session.execute(
+            dialect_insert(session.get_bind(), UserStats)
+            .values(user_id=user_id, words=0, starred=0, quizzes=1, correct=correct)
+            .on_conflict_do_update(index_elements=["user_id"], set_={"quizzes": UserStats.quizzes + 1, "correct": UserStats.correct + correct})
+        )
+        return word.due_at
+
+def query_user_stats(session, user_id, days=30):
+    """
+    Totals and the words added on each of the last `days` UTC days (oldest first, zeros included) for one user.
+    Reads one user_stats row and at most `days` user_daily_stats rows, however long the word list is.
+    """
+    stats = session.get(UserStats, user_id)
+    words, starred = (stats.words, stats.starred) if stats else (0, 0)
+    quizzes, correct = (stats.quizzes, stats.correct) if stats else (0, 0)
+    result = {
+        "words": words,
+        "starred": starred,
+        "starred_ratio": round(starred / words, 4) if words else None,
+        "quizzes": quizzes,
+        "correct": correct,
+        "correct_rate": round(correct / quizzes, 4) if quizzes else None,
+        "added_per_day": [],
+    }
+    if days > 0:
+        today = datetime.utcnow().date()
+        first = (today - timedelta(days=days - 1)).isoformat()
+        added = dict(session.query(UserDailyStats.day, UserDailyStats.added).filter(
+            UserDailyStats.user_id == user_id, UserDailyStats.day >= first
+        ).all())
+        for offset in range(days - 1, -1, -1):
+            day = (today - timedelta(days=offset)).isoformat()
+            result["added_per_day"].append({"day": day, "added": added.get(day, 0)})
+    return result
+
+def get_user_stats(user_id, days=30):
+    with session_scope() as session:
+        return query_user_stats(session, user_id, days)
+
+def repair_user_stats(user_id=None):
+    """Recompute the word statistics of one user, or of everyone, from the vocabulary table."""
+    with session_scope() as session:
+        migrations.rebuild_user_stats(session.connection(), user_id)
 
 def get_starred_words(user_id):
-    session = get_session()
-    return [word.word for word in session.query(Vocabulary).filter_by(user_id=user_id, starred=True).all()]
+    with session_scope() as session:
+        return [word for (word,) in session.query(Vocabulary.word).filter_by(user_id=user_id, starred=True).all()]
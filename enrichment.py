@@ -0,0 +1,157 @@
+"""
+Background enrichment of saved words with a translation, a definition and an example sentence.
+
+VocabularyEnricher walks the vocabulary table on its own thread, collects words that have no row in
+vocabulary_enrichment yet for their owner's languages, groups them by (language, native language) and asks
+for dozens of words in one structured LLM call instead of one call per word. Results are stored once per
+(word, language, native language) and shared by every user who saved the word, so common words are only
+ever enriched once. Words the model leaves out are stored empty with a time to try them again
+(ENRICHMENT_MISSING_RETRY_DAYS), and the scan starts over from the first row every ENRICHMENT_RESCAN_INTERVAL,
+so neither a refusal nor an empty answer is final and a changed native language is caught up with. The
+vocabulary page reads the table directly and never waits on the LLM; words it shows that aren't enriched yet
+are moved to the front of the queue with request().
+"""
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+import config
+from database import get_unenriched_words, get_enrichments, save_enrichments
+
+log = logging.getLogger(__name__)
+
+MAX_FIELD_CHARS = 500 # a runaway answer for one word shouldn't end up on the page
+
+def _field(entry, name):
+    value = entry.get(name)
+    if not isinstance(value, str) or not value.strip():
+        return None
+    return value.strip()[:MAX_FIELD_CHARS]
+
+def parse_enrichment(response, words):
+    """
+    {word: (translation, definition, example)} for the requested words the model's JSON answer has something
+    for. Words it leaves out, or gives no text for, are missing from the result.
+    """
+    try:
+        data = json.loads(response)
+    except ValueError:
+        raise ValueError(f"Enrichment answer is not JSON: {response[:200]!r}")
+    entries = data.get("words") if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        entries = [] # valid JSON without the list is an answer too, just an empty one
+    wanted = {word.casefold(): word for word in words}
+    result = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or not isinstance(entry.get("word"), str):
+            continue
+        # Matched ignoring case, models like to capitalise the first word of a phrase
+        word = wanted.get(entry["word"].strip().casefold())
+        fields = (_field(entry, "translation"), _field(entry, "definition"), _field(entry, "example"))
+        if word is not None and any(fields):
+            result[word] = fields
+    return result
+
+class VocabularyEnricher:
+    def __init__(self, gateway, batch_size=None, scan_size=None):
+        self.gateway = gateway
+        self.batch_size = batch_size or config.ENRICHMENT_BATCH_SIZE
+        self.scan_size = scan_size or config.ENRICHMENT_SCAN_SIZE
+        self._after_id = 0 # vocabulary id the table scan continues from
+        self._pass_started = time.monotonic()
+        self._lock = threading.Lock()
+        self._requested = {} # (language, native language) -> words the page asked for, in order
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="vocab-enrichment", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def request(self, words, language, native_language):
+        """Enrich these words before continuing the table scan. Returns immediately."""
+        if not words or not language or not native_language:
+            return
+        with self._lock:
+            queued = self._requested.setdefault((language, native_language), {})
+            for word in words:
+                queued[word] = None
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                enriched = self.enrich_once()
+                delay = config.ENRICHMENT_IDLE_INTERVAL if enriched is None else 0
+            except Exception:
+                # The scan position only moves on after a window is done, so its words are tried again
+                log.exception("Vocabulary enrichment error")
+                delay = config.ENRICHMENT_RETRY_DELAY
+            if delay:
+                self._wake.wait(delay)
+                self._wake.clear()
+
+    def enrich_once(self):
+        """
+        Enrich the requested words, or else the next window of the table scan. Returns how many words were
+        enriched, or None once the scan reached the end of the table with nothing requested.
+        """
+        with self._lock:
+            requested, self._requested = self._requested, {}
+        if requested:
+            groups = {}
+            for (language, native), words in requested.items():
+                done = get_enrichments(list(words), language, native)
+                groups[(language, native)] = [word for word in words if word not in done]
+            try:
+                return self._enrich_groups(groups)
+            except Exception:
+                for key, words in requested.items():
+                    self.request(list(words), *key) # keep them at the front for the retry
+                raise
+
+        keys, last_id = get_unenriched_words(self._after_id, self.scan_size)
+        if last_id is None:
+            # Misses whose retry_at has passed, and words whose owner changed native language, are all behind the
+            # cursor. Until it is time for another pass, only rows added since are scanned.
+            if time.monotonic() - self._pass_started >= config.ENRICHMENT_RESCAN_INTERVAL:
+                self._after_id = 0
+                self._pass_started = time.monotonic()
+            return None
+        groups = defaultdict(list)
+        for word, language, native in keys:
+            groups[(language, native)].append(word)
+        stored = self._enrich_groups(groups)
+        self._after_id = last_id
+        return stored
+
+    def _enrich_groups(self, groups):
+        stored = 0
+        for (language, native), words in groups.items():
+            for start in range(0, len(words), self.batch_size):
+                stored += self._enrich(words[start:start + self.batch_size], language, native)
+        return stored
+
+    def _enrich(self, words, language, native_language):
+        """One LLM call for up to batch_size words of the same language pair."""
+        if not words:
+            return 0
+        response = self.gateway.complete("vocabulary_enrichment", {
+            "language": language,
+            "native_language": native_language,
+            "words": json.dumps(words, ensure_ascii=False),
+        })
+        entries = parse_enrichment(response, words)
+        save_enrichments(language, native_language, self.gateway.model, entries, missing=words)
+        return len(entries)
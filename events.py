@@ -0,0 +1,189 @@
+"""
+Push notifications for vocabulary changes.
+
+api_app runs a ChangeBroker that watches the vocabulary_changes log (woken straight away by its own write
+endpoints, otherwise checking every VOCAB_EVENTS_POLL_INTERVAL seconds) and publishes one Server-Sent Event per
+user whose words changed, on GET /api/vocabulary/events:
+
+    event: changes
+    id: 1234
+    data: {"user_id": 1, "cursor": 1234}
+
+The Streamlit app keeps a single connection open through ChangeListener, which remembers the newest cursor per
+user; a page only pulls a delta when that cursor moved since its last pull, so an idle page causes no sync
+requests at all. Reconnects resume from the last event id, so nothing is missed while the stream is down.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+import requests
+from sqlalchemy import func, select
+
+import config
+from database import VocabularyChange, async_session_scope
+from sync import backoff_delay, make_http_session
+
+log = logging.getLogger(__name__)
+
+async def changed_users(since):
+    """{user_id: newest change id} for every user with changes after `since`."""
+    # Seek on the primary key first and group what's left. Grouping the table directly gets planned as a scan of the
+    # whole user_id index, which grows with the log (over 100 ms at 2M rows against well under 1 ms for the range).
+    recent = (
+        select(VocabularyChange.user_id, VocabularyChange.id)
+        .where(VocabularyChange.id > since)
+        .order_by(VocabularyChange.id)
+        .subquery()
+    )
+    async with async_session_scope() as session:
+        rows = await session.execute(select(recent.c.user_id, func.max(recent.c.id)).group_by(recent.c.user_id))
+        return dict(rows.all())
+
+def format_event(user_id, cursor):
+    return f'event: changes\nid: {cursor}\ndata: {json.dumps({"user_id": user_id, "cursor": cursor})}\n\n'
+
+class Subscription:
+    """Pending notifications for one stream, coalesced per user so a slow reader can't pile them up."""
+    def __init__(self, user_id=None):
+        self.user_id = user_id # None: every user
+        self._pending = {}
+        self._ready = asyncio.Event()
+
+    def put(self, user_id, cursor):
+        if self.user_id is None or self.user_id == user_id:
+            self._pending[user_id] = max(cursor, self._pending.get(user_id, 0))
+            self._ready.set()
+
+    async def get(self):
+        """Wait for notifications, then return them as {user_id: cursor}."""
+        await self._ready.wait()
+        self._ready.clear()
+        pending, self._pending = self._pending, {}
+        return pending
+
+class ChangeBroker:
+    def __init__(self, poll_interval=None):
+        self.poll_interval = poll_interval or config.VOCAB_EVENTS_POLL_INTERVAL
+        self._subscriptions = set()
+        self._wake = asyncio.Event()
+        self._cursor = 0
+        self._task = None
+        self._stopping = False
+
+    async def start(self):
+        async with async_session_scope() as session:
+            self._cursor = await session.scalar(select(func.max(VocabularyChange.id))) or 0
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Finish the current check rather than cancelling it; a query cancelled halfway can leave its connection hanging
+        self._stopping = True
+        self._wake.set()
+        if self._task:
+            await self._task
+
+    def notify(self):
+        """Check the change log now; called by the write endpoints after they commit."""
+        self._wake.set()
+
+    def subscribe(self, user_id=None):
+        subscription = Subscription(user_id)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscriptions.discard(subscription)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._stopping:
+                return
+            try:
+                await self.publish_once()
+            except Exception:
+                log.exception("Change broker error")
+
+    async def publish_once(self):
+        changed = await changed_users(self._cursor)
+        if not changed:
+            return
+        self._cursor = max(changed.values())
+        for subscription in list(self._subscriptions):
+            for user_id, cursor in changed.items():
+                subscription.put(user_id, cursor)
+
+class ChangeListener:
+    """
+    Client for /api/vocabulary/events on its own thread. version(user_id) is the newest change cursor seen for
+    that user on the server; it only moves when their words change there.
+    """
+    def __init__(self, user_id=None, since=0, api_url=None, http=None):
+        self.api_url = (api_url or config.VOCAB_API_URL).rstrip("/")
+        self.http = http or make_http_session(pool_size=1)
+        self.user_id = user_id # None: every user
+        self.connected = False
+        self._cursor = since # the first connect replays what changed after this
+        self._versions = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="vocab-events", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set() # noticed at the next event or keep-alive
+        if self._thread:
+            self._thread.join(timeout)
+
+    def version(self, user_id):
+        return self._versions.get(user_id, 0)
+
+    def _run(self):
+        failures = 0
+        while not self._stop.is_set():
+            try:
+                self._listen()
+                failures = 0
+            except (requests.exceptions.RequestException, ValueError):
+                if self._stop.is_set():
+                    return
+                self.connected = False
+                self._stop.wait(backoff_delay(failures))
+                failures += 1
+
+    def _params(self):
+        params = {"since": self._cursor}
+        if self.user_id is not None:
+            params["user_id"] = self.user_id
+        return params
+
+    def _listen(self):
+        # The server sends a comment every VOCAB_EVENTS_HEARTBEAT seconds, so a longer silence means a dead connection
+        timeout = (config.SYNC_CONNECT_TIMEOUT, config.VOCAB_EVENTS_HEARTBEAT * 2 + config.SYNC_READ_TIMEOUT)
+        with self.http.get(f"{self.api_url}/api/vocabulary/events", params=self._params(), stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            self.connected = True
+            event = {}
+            for line in response.iter_lines(decode_unicode=True):
+                if self._stop.is_set():
+                    return
+                if line:
+                    field, _, value = line.partition(":")
+                    event[field] = value.lstrip(" ")
+                    continue
+                if event.get("event") == "changes" and "data" in event:
+                    change = json.loads(event["data"])
+                    self._versions[change["user_id"]] = change["cursor"]
+                    self._cursor = max(self._cursor, change["cursor"])
+                event = {}
+        self.connected = False
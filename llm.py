@@ -0,0 +1,262 @@
+"""
+Gateway for every LLM call the app makes.
+
+Owns the prompt templates, model selection, timeouts and retries, the response cache, a global limit on
+concurrent requests and deduplication of identical in-flight requests (singleflight). The backend is
+pluggable: "openai" talks to the real API, "stub" returns deterministic text after a configurable delay so
+the quiz and revise flows can be load-tested offline without spending anything.
+
+    gateway = LLMGateway()
+    question = gateway.complete("quiz_question", {"word": "hola", "language": "Spanish"})
+    for delta in gateway.stream("quiz_feedback", {"question": question, "response": answer, "word": "hola"}):
+        ...
+"""
+import hashlib
+import random
+import threading
+import time
+
+import config
+from llm_cache import LLMCache, make_cache_key
+from metrics import record_llm_call, record_llm_tokens
+
+TEACHER_FEEDBACK_SYSTEM = "You are a language teacher helping a student learn a new language by giving them feedback on their writing."
+
+# Bump a prompt's version whenever its wording changes so old cached responses stop being served
+PROMPTS = {
+    "quiz_question": {
+        "version": "1",
+        "system": "You are a language teacher helping a student learn a new language through quizzing them about new vocabulary words.",
+        "user": "You are talking directly to the student. Write a question that will prompt the student to put the word '{word}' into context. Please respond in {language}.",
+    },
+    "quiz_feedback": {
+        "version": "1",
+        "system": TEACHER_FEEDBACK_SYSTEM,
+        "user": "The student is responding to this prompt: {question}\nThe student's writing: {response}\nThe word they were supposed to use is: {word}\nPlease check if they used the word correctly and naturally in their response. List at least 1 strength and give the student 1-2 pieces of feedback on their writing. Evaluate the student's writing with an emphasis on the student’s contextualization of the vocabulary word. Please respond in English and respond as if you were speaking directly to the student.",
+    },
+    # Revise my writing: one prompt per aspect, each run on every chunk of the text (see writing_review.py)
+    "writing_grammar": {
+        "version": "1",
+        "system": TEACHER_FEEDBACK_SYSTEM,
+        "user": "{intro} {writing}\n Please give the student feedback on their grammar and on any other areas of language accuracy in which there is room for improvement. Only cover grammar and accuracy; other teachers are reviewing the rest. Please respond as if you are speaking directly to the student and respond in English.",
+    },
+    "writing_culture": {
+        "version": "1",
+        "system": TEACHER_FEEDBACK_SYSTEM,
+        "user": "{intro} {writing}\n Please give the student feedback on social convention. For example, give feedback on whether the student's writing aligns with the country's social customs or whether the words and phrases the student is using are culturally appropriate. Only cover social convention; other teachers are reviewing the rest. Please respond as if you are speaking directly to the student and respond in English.",
+    },
+    "writing_naturalness": {
+        "version": "1",
+        "system": TEACHER_FEEDBACK_SYSTEM,
+        "user": "{intro} {writing}\n If the student spoke this way, would they sound like a native speaker? If not, how can they improve? Only cover how natural the writing sounds; other teachers are reviewing the rest. Please respond as if you are speaking directly to the student and respond in English.",
+    },
+    # Many words in one call (see enrichment.py). The vocabulary_enrichment table is the cache, so no llm_cache entries
+    "vocabulary_enrichment": {
+        "version": "1",
+        "json": True,
+        "cache": False,
+        "system": "You are a bilingual dictionary for language learners. You always answer with a JSON object.",
+        "user": "Here is a JSON list of {language} words and phrases saved by students whose native language is {native_language}: {words}\nFor every one of them give a short translation into {native_language}, a one-sentence definition written in {native_language}, and one simple example sentence in {language} that uses it. Answer with a JSON object of the form {{\"words\": [{{\"word\": \"...\", \"translation\": \"...\", \"definition\": \"...\", \"example\": \"...\"}}]}}, one entry per word, with each word spelled exactly as given. Leave out anything that is not a real {language} word or phrase.",
+    },
+}
+
+def render_prompt(name, inputs):
+    template = PROMPTS[name]
+    return [
+        {"role": "system", "content": template["system"]},
+        {"role": "user", "content": template["user"].format(**inputs)},
+    ]
+
+class OpenAIBackend:
+    def __init__(self, api_key=None, timeout=None, max_retries=None):
+        from openai import OpenAI
+        # The client retries connection errors, 429s and 5xx responses itself, with exponential backoff
+        self.client = OpenAI(
+            api_key=api_key or config.OPENAI_API_KEY,
+            timeout=timeout or config.LLM_TIMEOUT,
+            max_retries=config.LLM_MAX_RETRIES if max_retries is None else max_retries,
+        )
+
+    def complete(self, model, messages, json_object=False):
+        kwargs = {"response_format": {"type": "json_object"}} if json_object else {}
+        response = self.client.chat.completions.create(model=model, messages=messages, **kwargs)
+        if response.usage:
+            record_llm_tokens(model, response.usage.prompt_tokens, response.usage.completion_tokens)
+        return response.choices[0].message.content
+
+    def stream(self, model, messages):
+        # include_usage adds a last chunk with no choices that carries the token counts
+        chunks = self.client.chat.completions.create(model=model, messages=messages, stream=True, stream_options={"include_usage": True})
+        for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if chunk.usage:
+                record_llm_tokens(model, chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+
+class StubBackend:
+    """Offline backend: the same messages always produce the same text, after latency + tokens * token_delay seconds."""
+    WORDS = ["bien", "hecho", "good", "try", "the", "word", "fits", "here", "consider", "using", "a", "more",
+             "natural", "phrase", "your", "grammar", "is", "clear", "nice", "context", "sentence", "tense"]
+
+    def __init__(self, latency=None, token_delay=None, tokens=None):
+        self.latency = config.LLM_STUB_LATENCY if latency is None else latency
+        self.token_delay = config.LLM_STUB_TOKEN_DELAY if token_delay is None else token_delay
+        self.tokens = tokens or config.LLM_STUB_TOKENS
+
+    def _tokens(self, model, messages):
+        seed = hashlib.sha256(repr((model, messages)).encode("utf-8")).hexdigest()
+        rng = random.Random(seed)
+        return [rng.choice(self.WORDS) + " " for _ in range(self.tokens)]
+
+    def _record_usage(self, model, messages, tokens):
+        # Words stand in for tokens, close enough to see the load a test would put on the real API
+        record_llm_tokens(model, sum(len(message["content"].split()) for message in messages), len(tokens))
+
+    def complete(self, model, messages, json_object=False):
+        tokens = self._tokens(model, messages)
+        time.sleep(self.latency + self.token_delay * len(tokens))
+        self._record_usage(model, messages, tokens)
+        if json_object:
+            return "{}" # the stub can't know the schema a prompt asks for; an empty object is still valid JSON
+        return "".join(tokens).strip()
+
+    def stream(self, model, messages):
+        time.sleep(self.latency)
+        tokens = self._tokens(model, messages)
+        for token in tokens:
+            time.sleep(self.token_delay)
+            yield token
+        self._record_usage(model, messages, tokens)
+
+BACKENDS = {"openai": OpenAIBackend, "stub": StubBackend}
+
+def make_backend(name=None):
+    name = name or config.LLM_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend '{name}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name]()
+
+class _Call:
+    """One in-flight request that identical callers wait on instead of sending their own."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class LLMGateway:
+    def __init__(self, backend=None, model=None, max_concurrency=None, cache=None):
+        self.backend = backend or make_backend()
+        self.model = model or config.LLM_MODEL
+        self.cache = cache if cache is not None else LLMCache()
+        self._slots = threading.BoundedSemaphore(max_concurrency or config.LLM_MAX_CONCURRENCY)
+        self._lock = threading.Lock()
+        self._in_flight = {} # cache key -> _Call
+
+    def complete(self, name, inputs, variants=1, cache_inputs=None):
+        """
+        The full response for a prompt template. Served from the cache once the key holds `variants`
+        responses; identical concurrent requests share one backend call.
+        cache_inputs overrides the inputs used for the cache key (e.g. to ignore case).
+        """
+        start = time.perf_counter()
+        key_inputs = {"task": name, **(cache_inputs or inputs)}
+        version = PROMPTS[name]["version"]
+        use_cache = PROMPTS[name].get("cache", True)
+        cached = self.cache.get(self.model, version, key_inputs, variants) if use_cache else None
+        if cached is not None:
+            elapsed = time.perf_counter() - start
+            record_llm_call(name, elapsed, elapsed, cached=True)
+            return cached
+        def generate():
+            response = self._complete(name, inputs)
+            if use_cache:
+                self.cache.put(self.model, version, key_inputs, response, variants)
+            return response
+        # Only the first of several identical callers generates and caches, the rest share its response
+        response = self._single_flight(make_cache_key(self.model, version, key_inputs), generate)
+        elapsed = time.perf_counter() - start
+        record_llm_call(name, elapsed, elapsed)
+        return response
+
+    def stream(self, name, inputs):
+        """
+        Yield the response for a prompt template as it arrives. A cached response is yielded in one piece, and a
+        caller that arrives while an identical stream is running waits for it and gets its full text.
+        """
+        start = time.perf_counter()
+        key_inputs = {"task": name, **inputs}
+        version = PROMPTS[name]["version"]
+        cached = self.cache.get(self.model, version, key_inputs)
+        if cached is not None:
+            elapsed = time.perf_counter() - start
+            record_llm_call(name, elapsed, elapsed, cached=True)
+            yield cached
+            return
+
+        key = make_cache_key(self.model, version, key_inputs)
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+        if not leader:
+            yield self._wait(call, lambda: self._complete(name, inputs))
+            elapsed = time.perf_counter() - start
+            record_llm_call(name, elapsed, elapsed, cached=True)
+            return
+
+        parts = []
+        first_token_at = None
+        try:
+            with self._slots:
+                for delta in self.backend.stream(self.model, render_prompt(name, inputs)):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    parts.append(delta)
+                    yield delta
+            call.result = "".join(parts)
+            self.cache.put(self.model, version, key_inputs, call.result)
+        except BaseException as e:
+            # Includes GeneratorExit when the reader stops early; waiting callers then retry on their own
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+        end = time.perf_counter()
+        record_llm_call(name, (first_token_at or end) - start, end - start)
+
+    def _complete(self, name, inputs):
+        with self._slots:
+            if PROMPTS[name].get("json"):
+                return self.backend.complete(self.model, render_prompt(name, inputs), json_object=True)
+            return self.backend.complete(self.model, render_prompt(name, inputs))
+
+    def _single_flight(self, key, fn):
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+        if not leader:
+            return self._wait(call, fn)
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+        return call.result
+
+    def _wait(self, call, fallback):
+        call.done.wait()
+        if call.error is not None:
+            if isinstance(call.error, Exception):
+                raise call.error
+            return fallback() # the leader was cancelled rather than failing, so send our own request
+        return call.result
+
+    def _finish(self, key, call):
+        with self._lock:
+            self._in_flight.pop(key, None)
+        call.done.set()
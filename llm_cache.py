@@ -0,0 +1,121 @@
+"""
+Persistent cache for LLM responses, stored in the llm_cache table.
+
+Entries are keyed by model, prompt template version and the normalized prompt inputs, so changing a
+prompt only requires bumping its version. Each key can hold several variants: until a key has
+`variants` responses a lookup is treated as a miss and a new response is generated and added, after
+that a random stored variant is returned. Entries expire after a TTL and the least recently used ones
+are evicted once the table grows past max_entries, checked every EVICT_EVERY puts rather than on each one.
+Hit and miss counts are exported by the app as llm_cache_lookups_total and shown in the perf panel.
+"""
+import hashlib
+import json
+import random
+import threading
+import unicodedata
+from datetime import datetime, timedelta
+
+import config
+from database import LLMCacheEntry, dialect_insert, session_scope
+
+EVICT_EVERY = 100 # puts between eviction passes; the table can run over max_entries by this much
+
+def normalize_input(value):
+    """Canonical form of a prompt input: NFC unicode with whitespace collapsed. Non-strings pass through."""
+    if isinstance(value, str):
+        return " ".join(unicodedata.normalize("NFC", value).split())
+    return value
+
+def make_cache_key(model, template_version, inputs):
+    payload = {
+        "model": model,
+        "template_version": str(template_version),
+        "inputs": {name: normalize_input(value) for name, value in inputs.items()},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+class LLMCache:
+    def __init__(self, ttl_seconds=None, max_entries=None, enabled=None):
+        self.ttl = timedelta(seconds=ttl_seconds if ttl_seconds is not None else config.LLM_CACHE_TTL)
+        self.max_entries = max_entries if max_entries is not None else config.LLM_CACHE_MAX_ENTRIES
+        self.enabled = config.LLM_CACHE_ENABLED if enabled is None else enabled
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+
+    def get(self, model, template_version, inputs, variants=1):
+        """A cached response for these inputs, or None if the key has fewer than `variants` live entries."""
+        if not self.enabled:
+            return None
+        key = make_cache_key(model, template_version, inputs)
+        now = datetime.utcnow()
+        with session_scope() as session:
+            entries = session.query(LLMCacheEntry).filter(
+                LLMCacheEntry.cache_key == key, LLMCacheEntry.expires_at > now
+            ).all()
+            if len(entries) < variants:
+                self._count(hit=False)
+                return None
+            entry = random.choice(entries)
+            entry.hits += 1
+            entry.last_used_at = now
+            response = entry.response
+        self._count(hit=True)
+        return response
+
+    def put(self, model, template_version, inputs, response, variants=1):
+        """Store a response as a new variant for these inputs, replacing expired or surplus variants."""
+        if not self.enabled or not response:
+            return
+        key = make_cache_key(model, template_version, inputs)
+        now = datetime.utcnow()
+        with session_scope() as session:
+            entries = session.query(LLMCacheEntry).filter(LLMCacheEntry.cache_key == key).all()
+            live = [entry for entry in entries if entry.expires_at > now]
+            if len(live) >= variants:
+                return  # another caller filled the key meanwhile
+            used = {entry.variant for entry in live}
+            for entry in entries:
+                if entry not in live:
+                    session.delete(entry)
+            session.flush()
+            variant = next(index for index in range(variants + 1) if index not in used)
+            values = {
+                "model": model,
+                "template_version": str(template_version),
+                "response": response,
+                "created_at": now,
+                "expires_at": now + self.ttl,
+                "last_used_at": now,
+            }
+            # Another process may have stored the same variant since the read above; the newer response wins
+            statement = dialect_insert(session.get_bind(), LLMCacheEntry).values(cache_key=key, variant=variant, hits=0, **values)
+            session.execute(statement.on_conflict_do_update(index_elements=["cache_key", "variant"], set_=values))
+            with self._lock:
+                self._puts += 1
+                evict = self._puts % EVICT_EVERY == 0
+            if evict:
+                self._evict(session, now)
+
+    def _evict(self, session, now):
+        session.query(LLMCacheEntry).filter(LLMCacheEntry.expires_at <= now).delete(synchronize_session=False)
+        # One statement, no COUNT(*): everything but the max_entries most recently used
+        keep = session.query(LLMCacheEntry.id).order_by(LLMCacheEntry.last_used_at.desc()).limit(self.max_entries)
+        session.query(LLMCacheEntry).filter(LLMCacheEntry.id.not_in(keep.scalar_subquery())).delete(synchronize_session=False)
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,262 @@
+"""
+In-process performance measurements.
+
+Kept in memory per process; nothing here touches the database or the network, except the optional
+/metrics server the Streamlit app starts with start_metrics_server.
+
+With METRICS_ENABLED the counters and histograms below are filled and rendered in the Prometheus text format
+by render_metrics(): api_app serves them at /metrics, the Streamlit process on METRICS_PORT. Database queries
+are timed through SQLAlchemy cursor events (installed by database.py only when metrics or the sidebar panel are
+on) and added up per API request or Streamlit rerun, which is where N+1 query patterns show up.
+"""
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+
+log = logging.getLogger(__name__)
+
+_REGISTRY = []
+_registry_lock = threading.Lock()
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _REGISTRY.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+class Callback:
+    """A gauge (or a counter kept elsewhere) read when the metrics are rendered: fn() returns a number, or {label tuple: number}."""
+
+    def __init__(self, name, help, fn, labelnames=(), kind="gauge"):
+        self.name, self.help, self.labelnames, self.fn, self.kind = name, help, tuple(labelnames), fn, kind
+        with _registry_lock:
+            _REGISTRY.append(self)
+
+    def render(self):
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            if value is not None:
+                yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+# Seconds; from a fast cached read up to a slow LLM call
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=TIME_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {} # labels -> [counts per bucket (+Inf last), sum]
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _REGISTRY.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', _format_value(bound))])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+def render_metrics():
+    """Every metric in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_REGISTRY)
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HTTP_REQUEST_SECONDS = Histogram("http_request_duration_seconds", "api_app request latency by route.", ("method", "route", "status"))
+HTTP_REQUEST_QUERIES = Histogram("http_request_db_queries", "Database queries per api_app request.", ("route",), COUNT_BUCKETS)
+RERUN_SECONDS = Histogram("streamlit_rerun_duration_seconds", "Streamlit script run time by page.", ("page",))
+RERUN_QUERIES = Histogram("streamlit_rerun_db_queries", "Database queries per Streamlit rerun.", ("page",), COUNT_BUCKETS)
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "Time spent in each database statement.")
+DB_SLOW_QUERIES = Counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_MS.")
+DB_QUERY_HEAVY = Counter("db_query_heavy_requests_total", "Requests or reruns that ran at least QUERY_COUNT_WARN statements (likely N+1).", ("source",))
+LLM_CALL_SECONDS = Histogram("llm_call_duration_seconds", "LLM gateway call latency by prompt template.", ("name", "cached"))
+LLM_TTFT_SECONDS = Histogram("llm_time_to_first_token_seconds", "Time until the first streamed token reached the caller.", ("name",))
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens used by the LLM backend.", ("model", "kind"))
+
+# Most recent LLM calls, newest last
+LLM_CALLS = deque(maxlen=500)
+_llm_lock = threading.Lock()
+
+def record_llm_call(name, ttft, total, cached=False):
+    """
+    Record one LLM call. ttft is the time in seconds until the first token was shown to the user,
+    total the time until the response was complete. Non-streaming calls have ttft == total.
+    """
+    with _llm_lock:
+        LLM_CALLS.append({
+            "name": name,
+            "ttft": ttft,
+            "total": total,
+            "cached": cached,
+            "at": time.time(),
+        })
+    stats = _current_request.get()
+    if stats is not None:
+        stats.llm_calls += 1
+        stats.llm_seconds += total
+    if config.METRICS_ENABLED:
+        LLM_CALL_SECONDS.observe(total, name, "true" if cached else "false")
+        if not cached:
+            LLM_TTFT_SECONDS.observe(ttft, name)
+
+def record_llm_tokens(model, prompt_tokens, completion_tokens):
+    """Token usage reported by the backend for one call."""
+    if config.METRICS_ENABLED:
+        LLM_TOKENS.inc(model, "prompt", amount=prompt_tokens or 0)
+        LLM_TOKENS.inc(model, "completion", amount=completion_tokens or 0)
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else None
+
+def llm_call_summary():
+    """Per call name: number of calls, cache hits, and median time-to-first-token and total latency."""
+    with _llm_lock:
+        calls = list(LLM_CALLS)
+    summary = {}
+    for name in sorted({call["name"] for call in calls}):
+        matching = [call for call in calls if call["name"] == name]
+        summary[name] = {
+            "calls": len(matching),
+            "cached": sum(1 for call in matching if call["cached"]),
+            "median_ttft": _median([call["ttft"] for call in matching]),
+            "median_total": _median([call["total"] for call in matching]),
+        }
+    return summary
+
+# Database statements and LLM calls, added up per API request or Streamlit rerun by whoever called track_request()
+class RequestStats:
+    __slots__ = ("queries", "query_seconds", "slow_queries", "llm_calls", "llm_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.slow_queries = [] # (seconds, statement) for statements over SLOW_QUERY_MS
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+
+_current_request = contextvars.ContextVar("current_request", default=None)
+
+def track_request():
+    """Start adding up the work done in the current context (request task or script thread). Returns the RequestStats."""
+    stats = RequestStats()
+    _current_request.set(stats)
+    return stats
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """SQLAlchemy event listener, paired with after_cursor_execute (see database.py)."""
+    conn.info["query_started"] = time.perf_counter()
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop("query_started")
+    stats = _current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_seconds += elapsed
+    if config.METRICS_ENABLED:
+        DB_QUERY_SECONDS.observe(elapsed)
+    if elapsed * 1000 >= config.SLOW_QUERY_MS:
+        statement = " ".join(statement.split())[:300]
+        if stats is not None:
+            stats.slow_queries.append((elapsed, statement))
+        if config.METRICS_ENABLED:
+            DB_SLOW_QUERIES.inc()
+        log.warning("Slow query (%.0f ms): %s", elapsed * 1000, statement)
+
+def _check_query_count(source, where, stats):
+    if stats.queries >= config.QUERY_COUNT_WARN:
+        if config.METRICS_ENABLED:
+            DB_QUERY_HEAVY.inc(source)
+        log.warning("%s ran %d queries (%.0f ms), possibly N+1", where, stats.queries, stats.query_seconds * 1000)
+
+def record_request(method, route, status, seconds, stats):
+    HTTP_REQUEST_SECONDS.observe(seconds, method, route, str(status))
+    HTTP_REQUEST_QUERIES.observe(stats.queries, route)
+    _check_query_count("api", f"{method} {route}", stats)
+
+def record_rerun(page, seconds, stats):
+    if config.METRICS_ENABLED:
+        RERUN_SECONDS.observe(seconds, page)
+        RERUN_QUERIES.observe(stats.queries, page)
+    _check_query_count("streamlit", f"Rerun of {page!r}", stats)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args): # scrapes every few seconds would flood the console
+        pass
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serve /metrics on its own port from a daemon thread, for processes without a web framework of their own."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
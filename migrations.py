@@ -0,0 +1,289 @@
+"""
+Versioned, in-place schema migrations.
+
+Each migration is a (version, description, function) entry that runs once against an existing database.
+The current version is stored in the schema_version table, so upgrading never drops tables or loses vocabulary.
+Migrations must be idempotent because a brand new database already gets the latest tables from create_all().
+"""
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+def _backfill_user_defaults(conn):
+    # Replaces what dataset_db() used to do by dropping every table
+    conn.execute(text("UPDATE users SET nativeLang = 'English' WHERE nativeLang IS NULL"))
+    conn.execute(text("UPDATE users SET newLang = 'Spanish' WHERE newLang IS NULL"))
+    conn.execute(text("UPDATE users SET proficiency = 'Beginner' WHERE proficiency IS NULL"))
+
+def _vocabulary_indexes(conn):
+    # Keep one row per (user_id, word) before adding the unique index, preserving the star if any copy had it
+    conn.execute(text("""
+        UPDATE vocabulary SET starred = 1
+        WHERE id IN (
+            SELECT MIN(id) FROM vocabulary GROUP BY user_id, word HAVING MAX(starred) = 1
+        )
+    """))
+    conn.execute(text("""
+        DELETE FROM vocabulary
+        WHERE id NOT IN (SELECT MIN(id) FROM vocabulary GROUP BY user_id, word)
+    """))
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_vocabulary_user_word ON vocabulary (user_id, word)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_vocabulary_user_timestamp ON vocabulary (user_id, timestamp)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_vocabulary_user_starred_timestamp ON vocabulary (user_id, starred, timestamp)"))
+
+def _vocabulary_change_log(conn):
+    # Seed the log with the current vocabulary so a client starting from cursor 0 sees every word
+    if not conn.execute(text("SELECT 1 FROM vocabulary_changes LIMIT 1")).first():
+        conn.execute(text("""
+            INSERT INTO vocabulary_changes (user_id, word, op, timestamp)
+            SELECT user_id, word, 'add', timestamp FROM vocabulary ORDER BY id
+        """))
+    # Triggers record every write, including bulk inserts and deletes that bypass the ORM
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS trg_vocabulary_log_insert AFTER INSERT ON vocabulary
+        BEGIN
+            INSERT INTO vocabulary_changes (user_id, word, op, timestamp)
+            VALUES (new.user_id, new.word, 'add', CURRENT_TIMESTAMP);
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS trg_vocabulary_log_delete AFTER DELETE ON vocabulary
+        BEGIN
+            INSERT INTO vocabulary_changes (user_id, word, op, timestamp)
+            VALUES (old.user_id, old.word, 'delete', CURRENT_TIMESTAMP);
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS trg_vocabulary_log_update AFTER UPDATE OF word, user_id ON vocabulary
+        BEGIN
+            INSERT INTO vocabulary_changes (user_id, word, op, timestamp)
+            VALUES (old.user_id, old.word, 'delete', CURRENT_TIMESTAMP);
+            INSERT INTO vocabulary_changes (user_id, word, op, timestamp)
+            VALUES (new.user_id, new.word, 'add', CURRENT_TIMESTAMP);
+        END
+    """))
+
+def _vocabulary_search_index(conn):
+    # Full-text index over vocabulary words. unicode61 with remove_diacritics folds case and accents
+    # ("corazon" finds "corazón"), and the prefix option keeps 2 and 3 letter prefix queries on the index.
+    # The owner column holds a "u<user_id>" token so a search only visits that user's postings.
+    try:
+        conn.execute(text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS vocabulary_fts USING fts5(
+                word, owner, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+            )
+        """))
+    except OperationalError:
+        return  # SQLite built without FTS5, database.search_vocabulary falls back to a prefix scan
+    conn.execute(text("DELETE FROM vocabulary_fts"))
+    conn.execute(text("INSERT INTO vocabulary_fts (rowid, word, owner) SELECT id, word, 'u' || user_id FROM vocabulary"))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS trg_vocabulary_fts_insert AFTER INSERT ON vocabulary
+        BEGIN
+            INSERT INTO vocabulary_fts (rowid, word, owner) VALUES (new.id, new.word, 'u' || new.user_id);
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS trg_vocabulary_fts_delete AFTER DELETE ON vocabulary
+        BEGIN
+            DELETE FROM vocabulary_fts WHERE rowid = old.id;
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS trg_vocabulary_fts_update AFTER UPDATE OF word, user_id ON vocabulary
+        BEGIN
+            DELETE FROM vocabulary_fts WHERE rowid = old.id;
+            INSERT INTO vocabulary_fts (rowid, word, owner) VALUES (new.id, new.word, 'u' || new.user_id);
+        END
+    """))
+
+def _vocabulary_review_schedule(conn):
+    # Spaced repetition columns; create_all() only adds them to new databases
+    columns = {row[1] for row in conn.execute(text("PRAGMA table_info(vocabulary)"))}
+    for name, ddl in (
+        ("ease", "FLOAT NOT NULL DEFAULT 2.5"),
+        ("interval", "INTEGER NOT NULL DEFAULT 0"),
+        ("repetitions", "INTEGER NOT NULL DEFAULT 0"),
+        ("reviews", "INTEGER NOT NULL DEFAULT 0"),
+        ("due_at", "DATETIME"),
+    ):
+        if name not in columns:
+            conn.execute(text(f'ALTER TABLE vocabulary ADD COLUMN "{name}" {ddl}'))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_vocabulary_user_starred_due ON vocabulary (user_id, starred, due_at)"))
+
+def rebuild_user_stats(conn, user_id=None):
+    """
+    Recompute user_stats word counts and user_daily_stats from the vocabulary table, for one user or all.
+    Quiz counters can't be derived from the vocabulary, so they are kept as they are.
+    """
+    only = "" if user_id is None else "AND user_id = :user_id"
+    params = {"user_id": user_id}
+    conn.execute(text(f"DELETE FROM user_daily_stats WHERE true {only}"), params)
+    conn.execute(text(f"""
+        INSERT INTO user_daily_stats (user_id, day, added)
+        SELECT user_id, date(timestamp), COUNT(*) FROM vocabulary
+        WHERE user_id IS NOT NULL AND timestamp IS NOT NULL {only}
+        GROUP BY user_id, date(timestamp)
+    """), params)
+    conn.execute(text(f"""
+        UPDATE user_stats SET words = 0, starred = 0
+        WHERE NOT EXISTS (SELECT 1 FROM vocabulary WHERE vocabulary.user_id = user_stats.user_id) {only}
+    """), params)
+    # WHERE is required before ON CONFLICT in INSERT ... SELECT, or SQLite can't tell the upsert from a join
+    conn.execute(text(f"""
+        INSERT INTO user_stats (user_id, words, starred, quizzes, correct)
+        SELECT user_id, COUNT(*), COALESCE(SUM(starred), 0), 0, 0 FROM vocabulary
+        WHERE user_id IS NOT NULL {only}
+        GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET words = excluded.words, starred = excluded.starred
+    """), params)
+
+def _user_stats(conn):
+    # Counters kept in the same transaction as every vocabulary write, including bulk SQL the ORM never sees.
+    # user_daily_stats counts the words added each (UTC) day that are still in the list.
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS trg_vocabulary_stats_insert AFTER INSERT ON vocabulary
+        WHEN new.user_id IS NOT NULL
+        BEGIN
+            INSERT INTO user_stats (user_id, words, starred, quizzes, correct)
+            VALUES (new.user_id, 1, COALESCE(new.starred, 0), 0, 0)
+            ON CONFLICT (user_id) DO UPDATE SET words = words + 1, starred = starred + excluded.starred;
+            INSERT INTO user_daily_stats (user_id, day, added)
+            SELECT new.user_id, date(new.timestamp), 1 WHERE new.timestamp IS NOT NULL
+            ON CONFLICT (user_id, day) DO UPDATE SET added = added + 1;
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS trg_vocabulary_stats_delete AFTER DELETE ON vocabulary
+        WHEN old.user_id IS NOT NULL
+        BEGIN
+            UPDATE user_stats SET words = words - 1, starred = starred - COALESCE(old.starred, 0) WHERE user_id = old.user_id;
+            UPDATE user_daily_stats SET added = added - 1 WHERE user_id = old.user_id AND day = date(old.timestamp);
+        END
+    """))
+    # Starring is the common update and needs one statement; moving a row between users or days needs the lot
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS trg_vocabulary_stats_star AFTER UPDATE OF starred ON vocabulary
+        WHEN new.user_id IS NOT NULL AND old.user_id IS new.user_id AND old.timestamp IS new.timestamp
+        BEGIN
+            UPDATE user_stats SET starred = starred + COALESCE(new.starred, 0) - COALESCE(old.starred, 0) WHERE user_id = new.user_id;
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS trg_vocabulary_stats_move AFTER UPDATE OF user_id, timestamp ON vocabulary
+        WHEN old.user_id IS NOT new.user_id OR old.timestamp IS NOT new.timestamp
+        BEGIN
+            UPDATE user_stats SET words = words - 1, starred = starred - COALESCE(old.starred, 0) WHERE user_id = old.user_id;
+            UPDATE user_daily_stats SET added = added - 1 WHERE user_id = old.user_id AND day = date(old.timestamp);
+            INSERT INTO user_stats (user_id, words, starred, quizzes, correct)
+            SELECT new.user_id, 1, COALESCE(new.starred, 0), 0, 0 WHERE new.user_id IS NOT NULL
+            ON CONFLICT (user_id) DO UPDATE SET words = words + 1, starred = starred + excluded.starred;
+            INSERT INTO user_daily_stats (user_id, day, added)
+            SELECT new.user_id, date(new.timestamp), 1 WHERE new.user_id IS NOT NULL AND new.timestamp IS NOT NULL
+            ON CONFLICT (user_id, day) DO UPDATE SET added = added + 1;
+        END
+    """))
+    rebuild_user_stats(conn)
+
+# The insert triggers as _vocabulary_change_log, _vocabulary_search_index and _user_stats create them, plus the guard.
+# bulk_load_vocabulary_rows copies what they do; run check_bulk_load.py after changing either.
+_GUARDED_INSERT_TRIGGERS = {
+    "trg_vocabulary_log_insert": """
+        CREATE TRIGGER trg_vocabulary_log_insert AFTER INSERT ON vocabulary
+        WHEN NOT EXISTS (SELECT 1 FROM vocabulary_bulk_load)
+        BEGIN
+            INSERT INTO vocabulary_changes (user_id, word, op, timestamp)
+            VALUES (new.user_id, new.word, 'add', CURRENT_TIMESTAMP);
+        END
+    """,
+    "trg_vocabulary_fts_insert": """
+        CREATE TRIGGER trg_vocabulary_fts_insert AFTER INSERT ON vocabulary
+        WHEN NOT EXISTS (SELECT 1 FROM vocabulary_bulk_load)
+        BEGIN
+            INSERT INTO vocabulary_fts (rowid, word, owner) VALUES (new.id, new.word, 'u' || new.user_id);
+        END
+    """,
+    "trg_vocabulary_stats_insert": """
+        CREATE TRIGGER trg_vocabulary_stats_insert AFTER INSERT ON vocabulary
+        WHEN new.user_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM vocabulary_bulk_load)
+        BEGIN
+            INSERT INTO user_stats (user_id, words, starred, quizzes, correct)
+            VALUES (new.user_id, 1, COALESCE(new.starred, 0), 0, 0)
+            ON CONFLICT (user_id) DO UPDATE SET words = words + 1, starred = starred + excluded.starred;
+            INSERT INTO user_daily_stats (user_id, day, added)
+            SELECT new.user_id, date(new.timestamp), 1 WHERE new.timestamp IS NOT NULL
+            ON CONFLICT (user_id, day) DO UPDATE SET added = added + 1;
+        END
+    """,
+}
+
+def _bulk_load_guard(conn):
+    # bulk_load_vocabulary used to drop the insert triggers for the length of an import. Any schema change makes
+    # SQLite fail the next INSERT or DELETE on every other open connection once with "no such table: vocabulary"
+    # when a trigger writes to an FTS5 table (seen on 3.40). The triggers now skip rows while the guard table
+    # has a row instead, which the import writes and deletes again inside its own transaction.
+    conn.execute(text("CREATE TABLE IF NOT EXISTS vocabulary_bulk_load (id INTEGER PRIMARY KEY)"))
+    existing = set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")).scalars())
+    for name, sql in _GUARDED_INSERT_TRIGGERS.items():
+        if name in existing: # no FTS5, no search trigger
+            conn.execute(text(f"DROP TRIGGER {name}"))
+            conn.execute(text(sql))
+
+def _vocabulary_language(conn):
+    # Enrichment is keyed on the language a word was saved in, which the user's newLang stops telling once they
+    # switch languages. Rows that existed before can only be given the owner's current one.
+    columns = {row[1] for row in conn.execute(text("PRAGMA table_info(vocabulary)"))}
+    if "language" not in columns:
+        conn.execute(text("ALTER TABLE vocabulary ADD COLUMN language VARCHAR"))
+    conn.execute(text("""
+        UPDATE vocabulary SET language = (SELECT newLang FROM users WHERE users.id = vocabulary.user_id)
+        WHERE language IS NULL
+    """))
+    # Filled in for every write path, bulk SQL included, without each one having to look the user up.
+    # UPDATE OF language fires none of the other triggers.
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS trg_vocabulary_language AFTER INSERT ON vocabulary
+        WHEN new.language IS NULL AND new.user_id IS NOT NULL
+        BEGIN
+            UPDATE vocabulary SET language = (SELECT newLang FROM users WHERE id = new.user_id) WHERE id = new.id;
+        END
+    """))
+
+def _enrichment_retry(conn):
+    # Words the model left out used to be stored as empty rows for good. Existing empty rows are due straight away.
+    columns = {row[1] for row in conn.execute(text("PRAGMA table_info(vocabulary_enrichment)"))}
+    if "retry_at" not in columns:
+        conn.execute(text("ALTER TABLE vocabulary_enrichment ADD COLUMN retry_at DATETIME"))
+    conn.execute(text("""
+        UPDATE vocabulary_enrichment SET retry_at = created_at
+        WHERE retry_at IS NULL AND translation IS NULL AND definition IS NULL AND example IS NULL
+    """))
+
+# Append new migrations to the end of this list. Never renumber or edit one that has shipped.
+MIGRATIONS = [
+    (1, "backfill user language defaults", _backfill_user_defaults),
+    (2, "vocabulary indexes and unique (user_id, word)", _vocabulary_indexes),
+    (3, "vocabulary change log for delta sync", _vocabulary_change_log),
+    (4, "full-text search index on vocabulary words", _vocabulary_search_index),
+    (5, "spaced repetition schedule on vocabulary", _vocabulary_review_schedule),
+    (6, "per-user learning statistics", _user_stats),
+    (7, "guard the vocabulary insert triggers for bulk loads", _bulk_load_guard),
+    (8, "language of each saved word", _vocabulary_language),
+    (9, "retry enrichments the model left out", _enrichment_retry),
+]
+
+def get_schema_version(conn):
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+    return version or 0
+
+def run_migrations(engine):
+    """Apply every migration newer than the stored schema version. Returns the resulting version."""
+    with engine.begin() as conn:
+        current = get_schema_version(conn)
+        for version, description, migrate in MIGRATIONS:
+            if version <= current:
+                continue
+            migrate(conn)
+            conn.execute(text("INSERT INTO schema_version (version) VALUES (:version)"), {"version": version})
+            current = version
+    return current
@@ -0,0 +1,91 @@
+"""
+Background pre-generation of quiz questions.
+
+Questions are generated ahead of time for starred words and kept in the quiz_questions table, a small pool
+per (user, word, language). The quiz page pops a ready question instantly and the pool is topped up again
+in the background. A fixed-size thread pool bounds concurrent LLM calls, and every user has a cap on queued
+warm-ups and on background generations per hour, so one user starring hundreds of words can't starve the rest.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from database import count_quiz_questions, add_quiz_question, pop_quiz_question
+
+log = logging.getLogger(__name__)
+
+class QuizQuestionPool:
+    def __init__(self, generate, pool_size=None, workers=None, user_max_pending=None, user_hourly_quota=None):
+        """generate(word, language) must return a question string; it runs on the worker threads."""
+        self.generate = generate
+        self.pool_size = pool_size or config.QUIZ_POOL_SIZE
+        self.user_max_pending = user_max_pending or config.QUIZ_POOL_USER_MAX_PENDING
+        self.user_hourly_quota = user_hourly_quota or config.QUIZ_POOL_USER_HOURLY_QUOTA
+        self._executor = ThreadPoolExecutor(max_workers=workers or config.QUIZ_POOL_WORKERS, thread_name_prefix="quiz-pool")
+        self._lock = threading.Lock()
+        self._pending = set() # (user_id, word, language) already queued or running
+        self._pending_per_user = defaultdict(int)
+        self._rerun = set() # keys popped from while their top-up was running
+        self._generated_at = defaultdict(deque) # user_id -> times of recent background generations
+
+    def warm(self, user_id, word, language):
+        """Queue a top-up of this word's pool. Returns False if it was already queued or the user is over quota."""
+        key = (user_id, word, language)
+        with self._lock:
+            if key in self._pending:
+                self._rerun.add(key) # a top-up is already running; make it check the pool once more
+                return False
+            if self._pending_per_user[user_id] >= self.user_max_pending:
+                return False
+            self._pending.add(key)
+            self._pending_per_user[user_id] += 1
+        self._executor.submit(self._top_up, key)
+        return True
+
+    def warm_many(self, user_id, words, language):
+        """Queue top-ups for several words, stopping quietly once the user's queue is full."""
+        return sum(1 for word in words if self.warm(user_id, word, language))
+
+    def pop(self, user_id, word, language):
+        """A ready question for this word, or None if the pool is empty. Either way a top-up is queued."""
+        question = pop_quiz_question(user_id, word, language)
+        self.warm(user_id, word, language)
+        return question
+
+    def _take_quota(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            recent = self._generated_at[user_id]
+            while recent and now - recent[0] > 3600:
+                recent.popleft()
+            if len(recent) >= self.user_hourly_quota:
+                return False
+            recent.append(now)
+            return True
+
+    def _top_up(self, key):
+        user_id, word, language = key
+        while True:
+            try:
+                self._fill(user_id, word, language)
+            except Exception:
+                log.exception("Quiz pool warm-up failed for %r (%s)", word, language)
+            with self._lock:
+                if key in self._rerun:
+                    self._rerun.discard(key) # popped from while we were filling, go round again
+                    continue
+                self._pending.discard(key)
+                self._pending_per_user[user_id] -= 1
+                return
+
+    def _fill(self, user_id, word, language):
+        missing = self.pool_size - count_quiz_questions(user_id, word, language)
+        for _ in range(missing):
+            if not self._take_quota(user_id):
+                return
+            question = self.generate(word, language)
+            if question:
+                add_quiz_question(user_id, word, language, question)
@@ -0,0 +1,41 @@
+"""
+Recompute the per-user word statistics (user_stats, user_daily_stats) from the vocabulary table.
+
+    python repair_stats.py              # every user
+    python repair_stats.py --user-id 5
+
+The counters are kept by triggers on every write, so this is only needed after editing the database by
+hand with the triggers dropped, or to check them: --check prints the users whose counters were off.
+Quiz counters are left alone, the vocabulary table doesn't record them.
+"""
+import argparse
+
+from sqlalchemy import select
+
+from database import UserStats, init_db, repair_user_stats, session_scope
+
+def snapshot(user_id=None):
+    query = select(UserStats.user_id, UserStats.words, UserStats.starred)
+    if user_id is not None:
+        query = query.where(UserStats.user_id == user_id)
+    with session_scope() as session:
+        return {row.user_id: (row.words, row.starred) for row in session.execute(query)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", type=int, help="only this user")
+    parser.add_argument("--check", action="store_true", help="report the users whose counters changed")
+    args = parser.parse_args()
+
+    init_db()
+    before = snapshot(args.user_id) if args.check else None
+    repair_user_stats(args.user_id)
+    if args.check:
+        after = snapshot(args.user_id)
+        drifted = {user_id: (before.get(user_id), counts) for user_id, counts in after.items() if before.get(user_id) != counts}
+        for user_id, (old, new) in sorted(drifted.items()):
+            print(f"user {user_id}: (words, starred) {old} -> {new}")
+        print(f"{len(drifted)} of {len(after)} users repaired")
+
+if __name__ == "__main__":
+    main()
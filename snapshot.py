@@ -0,0 +1,172 @@
+"""
+Compact binary snapshot of a user's word set, served by GET /api/vocabulary/snapshot.
+
+The extension only needs to know whether a word on the page is already saved. A Bloom filter answers that in
+about 1.2 bytes per word at a 1% false-positive rate, against the full JSON list; the exact list can be added,
+sorted and front-coded (each word stored as the length of the prefix it shares with the previous word plus the
+rest). Everything is little-endian:
+
+    header   magic b"VSNP", u8 format (1), u8 flags (1 = word list included), u16 k, u32 m, u32 n, u64 version
+    filter   ceil(m / 8) bytes; bit i is byte i >> 3, mask 1 << (i & 7)
+    words    n times: varint shared prefix length, varint suffix length, suffix (UTF-8), sorted by UTF-8 bytes
+
+m is the filter size in bits, k the number of hash functions, n the number of words and version the change-log
+id the snapshot is current up to (as in the ETag of GET /api/vocabulary). A word is looked up by its exact
+UTF-8 bytes: with h1 the CRC-32 (as in zlib, gzip or PNG) of those bytes and h2 the CRC-32 of the same bytes in
+reverse order with its lowest bit set, the bits (h1 + i * h2) mod m for i in 0..k-1 must all be set.
+
+The filter keeps a count per bit next to the bits, so word_cache can apply added and deleted words to it as
+they happen instead of rebuilding it; it is only rebuilt once it holds more words than it was sized for.
+"""
+import math
+import struct
+import zlib
+
+MAGIC = b"VSNP"
+FORMAT_VERSION = 1
+FLAG_WORDS = 1
+HEADER = struct.Struct("<4sBBHIIQ")
+
+def bloom_positions(word, m, k):
+    data = word.encode("utf-8")
+    # An even step would only ever reach half of an even-sized filter
+    h1, h2 = zlib.crc32(data), zlib.crc32(data[::-1]) | 1
+    return [(h1 + i * h2) % m for i in range(k)]
+
+def bloom_size(capacity, fp_rate):
+    """(m bits, k hashes) for `capacity` words at the given false-positive rate. m is a whole number of bytes."""
+    capacity = max(capacity, 64)
+    m = math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2 / 8) * 8
+    return m, max(1, round(m / capacity * math.log(2)))
+
+class BloomFilter:
+    """A counting Bloom filter: words can be removed as well as added."""
+    __slots__ = ("m", "k", "capacity", "n", "bits", "counts")
+
+    def __init__(self, words, fp_rate):
+        words = list(words)
+        # Some headroom, so a few new words don't force a rebuild
+        self.capacity = max(64, math.ceil(len(words) * 1.25))
+        self.m, self.k = bloom_size(self.capacity, fp_rate)
+        self.n = 0
+        self.bits = bytearray(self.m // 8)
+        self.counts = bytearray(self.m) # saturate at 255; a saturated count is never decremented again
+        for word in words:
+            self.add(word)
+
+    @property
+    def size(self):
+        return len(self.bits) + len(self.counts)
+
+    def add(self, word):
+        self.n += 1
+        for i in bloom_positions(word, self.m, self.k):
+            if self.counts[i] < 255:
+                self.counts[i] += 1
+            self.bits[i >> 3] |= 1 << (i & 7)
+
+    def remove(self, word):
+        self.n -= 1
+        for i in bloom_positions(word, self.m, self.k):
+            if 0 < self.counts[i] < 255:
+                self.counts[i] -= 1
+                if not self.counts[i]:
+                    self.bits[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+    def __contains__(self, word):
+        return all(self.bits[i >> 3] & (1 << (i & 7)) for i in bloom_positions(word, self.m, self.k))
+
+def _varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return out
+
+def front_code(words):
+    """The words sorted by their UTF-8 bytes, each stored as shared prefix length, suffix length and suffix."""
+    out = bytearray()
+    previous = b""
+    for data in sorted(word.encode("utf-8") for word in words):
+        shared = 0
+        limit = min(len(previous), len(data))
+        while shared < limit and previous[shared] == data[shared]:
+            shared += 1
+        out += _varint(shared)
+        out += _varint(len(data) - shared)
+        out += data[shared:]
+        previous = data
+    return bytes(out)
+
+def encode(bloom, version, words=None):
+    """The snapshot payload; pass the word set to include the exact list."""
+    flags = FLAG_WORDS if words is not None else 0
+    parts = [HEADER.pack(MAGIC, FORMAT_VERSION, flags, bloom.k, bloom.m, bloom.n, version), bytes(bloom.bits)]
+    if words is not None:
+        parts.append(front_code(words))
+    return b"".join(parts)
+
+class Snapshot:
+    """The filter for one false-positive rate, plus the last payload encoded from it."""
+    __slots__ = ("fp_rate", "bloom", "payloads")
+
+    def __init__(self, words, fp_rate):
+        self.fp_rate = fp_rate
+        self.bloom = BloomFilter(words, fp_rate)
+        self.payloads = {} # with_words -> (version, bytes)
+
+    @property
+    def size(self):
+        return self.bloom.size + sum(len(payload) for _, payload in self.payloads.values())
+
+    def apply(self, added, removed, words):
+        """Update the filter for words added and removed; `words` is the set after the change."""
+        self.payloads.clear()
+        if len(words) > self.bloom.capacity:
+            self.bloom = BloomFilter(words, self.fp_rate) # outgrew its size, start again from the current words
+            return
+        for word in removed:
+            self.bloom.remove(word)
+        for word in added:
+            self.bloom.add(word)
+
+    def payload(self, version, words, with_words):
+        cached = self.payloads.get(with_words)
+        if cached is None or cached[0] != version:
+            cached = self.payloads[with_words] = (version, encode(self.bloom, version, words if with_words else None))
+        return cached[1]
+
+def decode(payload):
+    """(version, BloomFilter-like membership test, word list or None) from a payload; the reference reader."""
+    magic, format_version, flags, k, m, n, version = HEADER.unpack_from(payload)
+    if magic != MAGIC or format_version != FORMAT_VERSION:
+        raise ValueError("not a vocabulary snapshot")
+    offset = HEADER.size
+    bits = payload[offset:offset + m // 8]
+    offset += m // 8
+
+    def contains(word):
+        return all(bits[i >> 3] & (1 << (i & 7)) for i in bloom_positions(word, m, k))
+
+    words = None
+    if flags & FLAG_WORDS:
+        words, previous = [], b""
+
+        def read_varint():
+            nonlocal offset
+            value = shift = 0
+            while True:
+                byte = payload[offset]
+                offset += 1
+                value |= (byte & 0x7F) << shift
+                if byte < 0x80:
+                    return value
+                shift += 7
+
+        for _ in range(n):
+            shared, length = read_varint(), read_varint()
+            previous = previous[:shared] + payload[offset:offset + length]
+            offset += length
+            words.append(previous.decode("utf-8"))
+    return version, contains, words
@@ -0,0 +1,39 @@
+"""
+SM-2 spaced repetition.
+
+Every vocabulary word keeps an ease factor, the current interval in days, the number of successful reviews in
+a row and the time it is next due. A quiz answer is graded 0-5; a grade below 3 starts the word over, anything
+else pushes its next review further out by the ease factor, which itself moves with how hard the answer felt.
+"""
+from datetime import timedelta
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+
+# Self-grades offered after quiz feedback: (button label, SM-2 quality)
+GRADES = [
+    ("Again", 1),
+    ("Hard", 3),
+    ("Good", 4),
+    ("Easy", 5),
+]
+
+def schedule_review(ease, interval, repetitions, quality):
+    """Apply one graded review. Returns the new (ease, interval in days, repetitions)."""
+    ease = ease or DEFAULT_EASE
+    if quality < 3:
+        repetitions = 0
+        interval = 1
+    else:
+        repetitions += 1
+        if repetitions == 1:
+            interval = 1
+        elif repetitions == 2:
+            interval = 6
+        else:
+            interval = round(interval * ease)
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return ease, interval, repetitions
+
+def next_due(now, interval):
+    return now + timedelta(days=interval)
@@ -0,0 +1,98 @@
+"""
+Background delivery of vocabulary changes to the extension API.
+
+UI actions only write to the sync_outbox table (see database.enqueue_sync) and return immediately.
+OutboxWorker drains that table on its own thread, batching operations per user over a keep-alive
+connection pool and retrying failures with exponential backoff. Rows survive restarts, so nothing is lost
+while the API is down.
+"""
+import logging
+import random
+import threading
+from collections import defaultdict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+from database import get_due_sync_ops, complete_sync_ops, retry_sync_ops
+
+log = logging.getLogger(__name__)
+
+def backoff_delay(attempts):
+    """Seconds to wait before retrying an op that has already failed `attempts` times (with jitter)."""
+    delay = min(config.SYNC_BACKOFF_MAX, config.SYNC_BACKOFF_BASE * (2 ** attempts))
+    return delay * random.uniform(0.5, 1.0)
+
+def make_http_session(pool_size=None):
+    """A requests session that keeps connections to the API alive between batches."""
+    pool_size = pool_size or config.SYNC_HTTP_POOL_SIZE
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0) # retries are handled by the outbox
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+class OutboxWorker:
+    def __init__(self, api_url=None, http=None):
+        self.api_url = (api_url or config.VOCAB_API_URL).rstrip("/")
+        self.http = http or make_http_session()
+        self.timeout = (config.SYNC_CONNECT_TIMEOUT, config.SYNC_READ_TIMEOUT)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="vocab-outbox", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def wake(self):
+        """Ask the worker to drain the outbox now instead of at the next poll."""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                sent = self.drain_once()
+            except Exception:
+                log.exception("Outbox worker error")
+                sent = 0
+            if sent == 0:
+                # Nothing left to send right now; sleep until woken or the next poll
+                self._wake.wait(config.SYNC_POLL_INTERVAL)
+                self._wake.clear()
+
+    def drain_once(self):
+        """Send one round of due ops. Returns how many were delivered."""
+        ops = get_due_sync_ops(config.SYNC_BATCH_SIZE)
+        batches = defaultdict(list)
+        for op in ops:
+            batches[(op.user_id, op.op)].append(op)
+
+        delivered = 0
+        for (user_id, action), batch in batches.items():
+            try:
+                self._send(user_id, action, [op.word for op in batch])
+            except requests.exceptions.RequestException as e:
+                retry_sync_ops(batch, [backoff_delay(op.attempts) for op in batch], str(e))
+                continue
+            complete_sync_ops(batch)
+            delivered += len(batch)
+        return delivered
+
+    def _send(self, user_id, action, words):
+        url = f"{self.api_url}/api/vocabulary/batch"
+        payload = {"words": words, "user_id": user_id}
+        if action == "add":
+            response = self.http.post(url, json=payload, timeout=self.timeout)
+        else:
+            response = self.http.delete(url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
@@ -1,7 +1,17 @@
 import bcrypt # library for hashing and validating passwords
+import config
 
-def hash_password(password): #returns encrypted password
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+def hash_password(password, rounds=None): #returns encrypted password
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds or config.BCRYPT_ROUNDS)).decode('utf-8')
 
 def check_password(password, hashed): #checks user's plain password against the encrypted password
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+def hash_rounds(hashed): #the work factor a hash was made with, e.g. 12 for "$2b$12$..."
+    try:
+        return int(hashed.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+def needs_rehash(hashed, rounds=None): #true when a stored hash was made with a different work factor than configured
+    return hash_rounds(hashed) != (rounds or config.BCRYPT_ROUNDS)
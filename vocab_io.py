@@ -0,0 +1,246 @@
+"""
+Bulk export and import of a user's vocabulary as CSV or JSON Lines.
+
+Both directions stream: exports read the table through a server-side cursor in batches of VOCAB_IO_BATCH_SIZE
+rows and write each batch out as it arrives, imports parse the input incrementally and insert every batch in
+its own transaction. Memory stays bounded by the batch size however large the file is. Imported words the
+user already has are skipped by the unique (user_id, word) index.
+
+    python -m vocab_io export --user-id 1 --output words.csv
+    python -m vocab_io import --user-id 1 words.jsonl
+    python -m vocab_io import --user-id 1 words.csv --api http://localhost:8000   # through api_app instead
+
+CSV files have a header row with at least a "word" column ("starred" is optional); without a header the first
+column is the word. JSON Lines rows are objects like {"word": "hola", "starred": true} or plain strings.
+"""
+import argparse
+import codecs
+import csv
+import io
+import json
+import os
+import sys
+
+from sqlalchemy import select
+
+import config
+from database import Vocabulary, init_db, bulk_load_vocabulary, session_scope, async_session_scope
+
+FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+EXPORT_COLUMNS = ["word", "starred", "timestamp"]
+_TRUE = {"1", "true", "yes", "y", "t"}
+
+def export_statement(user_id):
+    return select(Vocabulary.word, Vocabulary.starred, Vocabulary.timestamp).where(
+        Vocabulary.user_id == user_id
+    ).order_by(Vocabulary.id).execution_options(yield_per=config.VOCAB_IO_BATCH_SIZE)
+
+def format_header(fmt):
+    return ",".join(EXPORT_COLUMNS) + "\r\n" if fmt == "csv" else ""
+
+def format_rows(rows, fmt):
+    """One batch of (word, starred, timestamp) rows as CSV or JSON Lines text."""
+    if fmt == "csv":
+        out = io.StringIO()
+        csv.writer(out).writerows(
+            (word, int(bool(starred)), timestamp.isoformat() if timestamp else "") for word, starred, timestamp in rows
+        )
+        return out.getvalue()
+    return "".join(
+        json.dumps({"word": word, "starred": bool(starred), "timestamp": timestamp.isoformat() if timestamp else None}, ensure_ascii=False) + "\n"
+        for word, starred, timestamp in rows
+    )
+
+def iter_export(user_id, fmt="csv"):
+    """Yield the user's vocabulary as text, one batch at a time."""
+    yield format_header(fmt)
+    with session_scope() as session:
+        for batch in session.execute(export_statement(user_id)).partitions():
+            yield format_rows(batch, fmt)
+
+async def aiter_export(user_id, fmt="csv"):
+    """Async version of iter_export for api_app, reading through a streaming AsyncResult."""
+    yield format_header(fmt)
+    async with async_session_scope() as session:
+        result = await session.stream(export_statement(user_id))
+        async for batch in result.partitions():
+            yield format_rows(batch, fmt)
+
+class ImportParser:
+    """
+    Incremental parser: feed() it chunks of bytes as they arrive and it returns the complete (word, starred)
+    rows found so far. Call close() at the end for whatever is left. Unusable rows are counted in `invalid`.
+    """
+    def __init__(self, fmt="csv"):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format '{fmt}', expected one of {sorted(FORMATS)}")
+        self.fmt = fmt
+        self.invalid = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+        self._partial = "" # text after the last newline
+        self._record = None # CSV record whose quoted field continues on the next line
+        self._columns = None # CSV (word index, starred index or None), known after the first row
+
+    def feed(self, data):
+        text = self._partial + (self._decoder.decode(data) if isinstance(data, bytes) else data)
+        lines = text.split("\n")
+        self._partial = lines.pop()
+        return self._parse(lines)
+
+    def close(self):
+        lines = [self._partial + self._decoder.decode(b"", final=True)]
+        self._partial = ""
+        rows = self._parse(lines)
+        if self._record is not None:
+            rows += self._parse_csv([self._record]) # unterminated quote, let csv make what it can of it
+            self._record = None
+        return rows
+
+    def _parse(self, lines):
+        return self._parse_csv(self._join_quoted(lines)) if self.fmt == "csv" else self._parse_jsonl(lines)
+
+    def _join_quoted(self, lines):
+        records = []
+        for line in lines:
+            record = line if self._record is None else self._record + "\n" + line
+            if record.count('"') % 2:
+                self._record = record # still inside a quoted field
+            else:
+                self._record = None
+                records.append(record)
+        return records
+
+    def _parse_csv(self, records):
+        rows = []
+        for fields in csv.reader(records):
+            if not fields:
+                continue
+            if self._columns is None:
+                names = [name.strip().lower() for name in fields]
+                if "word" in names:
+                    self._columns = (names.index("word"), names.index("starred") if "starred" in names else None)
+                    continue
+                self._columns = (0, 1 if len(fields) > 1 else None)
+            word_index, starred_index = self._columns
+            word = fields[word_index] if word_index < len(fields) else ""
+            if not word.strip():
+                self.invalid += 1
+                continue
+            starred = starred_index is not None and starred_index < len(fields) and fields[starred_index].strip().lower() in _TRUE
+            rows.append((word, starred))
+        return rows
+
+    def _parse_jsonl(self, lines):
+        rows = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                value = json.loads(line)
+            except ValueError:
+                self.invalid += 1
+                continue
+            if isinstance(value, dict):
+                word, starred = value.get("word"), bool(value.get("starred"))
+            else:
+                word, starred = value, False
+            if isinstance(word, str) and word.strip():
+                rows.append((word, starred))
+            else:
+                self.invalid += 1
+        return rows
+
+def import_rows(session, user_id, rows):
+    """Save one batch of (word, starred) rows, skipping words the user already has. Returns how many were added."""
+    seen = set()
+    unique = []
+    for word, starred in rows:
+        if word not in seen:
+            seen.add(word)
+            unique.append((word, starred))
+    return bulk_load_vocabulary(session, user_id, unique)
+
+def import_stream(user_id, chunks, fmt="csv"):
+    """Import from an iterable of byte chunks, committing every VOCAB_IO_BATCH_SIZE rows. Returns import totals."""
+    parser = ImportParser(fmt)
+    totals = {"rows": 0, "added": 0}
+    pending = []
+
+    def flush(batch):
+        with session_scope() as session:
+            totals["added"] += import_rows(session, user_id, batch)
+        totals["rows"] += len(batch)
+
+    for chunk in chunks:
+        pending.extend(parser.feed(chunk))
+        while len(pending) >= config.VOCAB_IO_BATCH_SIZE:
+            flush(pending[:config.VOCAB_IO_BATCH_SIZE])
+            del pending[:config.VOCAB_IO_BATCH_SIZE]
+    pending.extend(parser.close())
+    if pending:
+        flush(pending)
+    totals["skipped"] = totals["rows"] - totals["added"]
+    totals["invalid"] = parser.invalid
+    return totals
+
+def read_chunks(file, size=1 << 20):
+    while chunk := file.read(size):
+        yield chunk
+
+def guess_format(path, default="csv"):
+    extension = os.path.splitext(path or "")[1].lower().lstrip(".")
+    return {"csv": "csv", "jsonl": "jsonl", "ndjson": "jsonl"}.get(extension, default)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m vocab_io", description="Export or import a user's vocabulary as CSV or JSON Lines.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write the vocabulary to a file or stdout")
+    export.add_argument("--output", "-o", help="file to write (default: stdout)")
+    importer = commands.add_parser("import", help="add the words in a file to the vocabulary")
+    importer.add_argument("file", help="file to read, or - for stdin")
+    for command in (export, importer):
+        command.add_argument("--user-id", type=int, required=True)
+        command.add_argument("--format", choices=sorted(FORMATS), help="default: from the file extension, else csv")
+        command.add_argument("--api", help="go through api_app at this URL instead of opening the database")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        fmt = args.format or guess_format(args.output)
+        out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+        try:
+            if args.api:
+                import httpx
+                params = {"user_id": args.user_id, "format": fmt}
+                with httpx.stream("GET", f"{args.api.rstrip('/')}/api/vocabulary/export", params=params, timeout=None) as response:
+                    response.raise_for_status()
+                    for text in response.iter_text():
+                        out.write(text)
+            else:
+                init_db()
+                for text in iter_export(args.user_id, fmt):
+                    out.write(text)
+        finally:
+            if args.output:
+                out.close()
+        return
+
+    fmt = args.format or guess_format(args.file)
+    source = sys.stdin.buffer if args.file == "-" else open(args.file, "rb")
+    try:
+        if args.api:
+            import httpx
+            params = {"user_id": args.user_id, "format": fmt}
+            response = httpx.post(f"{args.api.rstrip('/')}/api/vocabulary/import", params=params, content=read_chunks(source), timeout=None)
+            response.raise_for_status()
+            totals = response.json()
+        else:
+            init_db()
+            totals = import_stream(args.user_id, read_chunks(source), fmt)
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+    print(json.dumps(totals), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+In-memory copy of each user's word list for api_app, so GET /api/vocabulary can answer without the database.
+
+An entry holds the words as a set of plain strings plus the change-log id it is current up to (its version, also the
+ETag), the encoded JSON body once it has been sent and any membership snapshots asked for (see snapshot.py).
+Entries never go stale silently: the change log is append-only, so an entry is brought up to date by applying the
+user's changes after its version.
+
+Writes made through this process catch the entry up right after they commit (write-through). Writes from
+other uvicorn workers or the Streamlit app are noticed through SQLite's PRAGMA data_version on a connection
+kept for the purpose, which changes whenever another connection commits and costs no table access; only then
+is the change log asked which users changed. Other databases ask the change log on every read.
+Least recently used entries are dropped past VOCAB_CACHE_MAX_BYTES.
+"""
+import asyncio
+import json
+import sqlite3
+import sys
+from collections import OrderedDict
+
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+
+import config
+from snapshot import Snapshot
+from database import Vocabulary, async_session_scope, get_vocabulary_version, get_vocabulary_changes, get_latest_change_id
+from events import changed_users
+
+MAX_SNAPSHOTS = 2 # false-positive rates kept per user; clients normally all ask for the same one
+
+class _Entry:
+    __slots__ = ("version", "words", "body", "snapshots", "size")
+
+    def __init__(self, version, words):
+        self.version = version
+        self.words = set(words)
+        self.body = None
+        self.snapshots = OrderedDict() # fp_rate -> Snapshot
+        self.size = sys.getsizeof(self.words) + sum(sys.getsizeof(word) for word in self.words)
+
+    def json(self):
+        if self.body is None:
+            # Same order SQLite returns them in through the (user_id, word) index, and the same encoding as JSONResponse
+            self.body = json.dumps(sorted(self.words), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            self.size += len(self.body)
+        return self.body
+
+    def apply(self, changes):
+        if self.body is not None:
+            self.size -= len(self.body)
+            self.body = None
+        self.size -= sys.getsizeof(self.words)
+        added, removed = [], []
+        for change in changes:
+            word = change["word"]
+            if change["op"] == "add" and word not in self.words:
+                self.words.add(word)
+                self.size += sys.getsizeof(word)
+                added.append(word)
+            elif change["op"] == "delete" and word in self.words:
+                self.words.remove(word)
+                self.size -= sys.getsizeof(word)
+                removed.append(word)
+        self.size += sys.getsizeof(self.words)
+        for snapshot in self.snapshots.values():
+            self.size -= snapshot.size
+            snapshot.apply(added, removed, self.words)
+            self.size += snapshot.size
+
+    def add_snapshot(self, fp_rate, snapshot):
+        self.snapshots[fp_rate] = snapshot
+        self.size += snapshot.size
+        while len(self.snapshots) > MAX_SNAPSHOTS:
+            self.size -= self.snapshots.popitem(last=False)[1].size
+
+    def snapshot_payload(self, fp_rate, with_words):
+        snapshot = self.snapshots[fp_rate]
+        self.snapshots.move_to_end(fp_rate)
+        self.size -= snapshot.size
+        payload = snapshot.payload(self.version, self.words, with_words)
+        self.size += snapshot.size
+        return payload
+
+class VocabularyCache:
+    def __init__(self, max_bytes=None):
+        self.max_bytes = config.VOCAB_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._entries = OrderedDict() # user_id -> _Entry, least recently used first
+        self._loading = {} # user_id -> task loading that user's list
+        self._syncing = None # the running sync() check, shared by everyone who reads meanwhile
+        self._cursor = 0 # newest change id the entries have been checked against
+        self._monitor = None
+        self._data_version = None
+        self.bytes = 0
+        self.hits = self.misses = self.catch_ups = self.evictions = 0
+
+    async def start(self):
+        url = make_url(config.DATABASE_URL)
+        if url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:"):
+            self._monitor = sqlite3.connect(url.database, check_same_thread=False)
+            self._data_version = self._read_data_version()
+        async with async_session_scope() as session:
+            self._cursor = await session.run_sync(get_latest_change_id)
+
+    def close(self):
+        if self._monitor is not None:
+            self._monitor.close()
+            self._monitor = None
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _read_data_version(self):
+        return self._monitor.execute("PRAGMA data_version").fetchone()[0]
+
+    async def get(self, user_id):
+        """The user's up-to-date entry, loading it on a miss."""
+        await self.sync()
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(user_id)
+            return entry
+        self.misses += 1
+        loading = self._loading.get(user_id)
+        if loading is not None:
+            return await asyncio.shield(loading) # someone is already loading this list, share their result
+        loading = self._loading[user_id] = asyncio.get_running_loop().create_task(self._load(user_id))
+        loading.add_done_callback(lambda task: self._loading.pop(user_id) if self._loading.get(user_id) is task else None)
+        return await asyncio.shield(loading) # a client hanging up shouldn't cancel the load for everyone else
+
+    async def _load(self, user_id):
+        async with async_session_scope() as session:
+            # Version first: words read afterwards can only be newer, and catching up is idempotent
+            version = await session.run_sync(get_vocabulary_version, user_id)
+            words = (await session.scalars(select(Vocabulary.word).where(Vocabulary.user_id == user_id))).all()
+        entry = _Entry(version, words)
+        self._store(user_id, entry)
+        if version < self._cursor:
+            await self.catch_up(user_id) # sync() may have moved past changes made while we were loading
+            if user_id not in self._entries:
+                return await self._load(user_id)
+        return entry
+
+    async def sync(self):
+        """Catch up the entries of users whose words changed since the last check."""
+        while self._entries:
+            if self._syncing is not None:
+                # A check is already running and may not have caught up yet; wait for it, then look again
+                await asyncio.shield(self._syncing)
+                continue
+            data_version = None
+            if self._monitor is not None:
+                data_version = self._read_data_version()
+                if data_version == self._data_version:
+                    return # nobody has committed anything
+            self._syncing = asyncio.get_running_loop().create_task(self._sync(data_version))
+            await asyncio.shield(self._syncing)
+            return
+
+    async def _sync(self, data_version):
+        try:
+            changed = await changed_users(self._cursor)
+            if changed:
+                self._cursor = max(self._cursor, max(changed.values()))
+                for user_id, version in changed.items():
+                    entry = self._entries.get(user_id)
+                    if entry is not None and entry.version < version:
+                        await self.catch_up(user_id)
+            self._data_version = data_version # only once everything it covers has been applied
+        finally:
+            self._syncing = None
+
+    async def catch_up(self, user_id):
+        """Apply the user's logged changes after the entry's version. The write endpoints call this after committing."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return
+        since = entry.version
+        async with async_session_scope() as session:
+            changes, cursor, has_more = await session.run_sync(get_vocabulary_changes, user_id, since, config.VOCAB_CACHE_MAX_DELTA)
+        if self._entries.get(user_id) is not entry or entry.version != since:
+            return # replaced or caught up by someone else while we waited
+        if has_more: # a big batch, reloading is cheaper
+            self._drop(user_id)
+            return
+        if changes:
+            self.catch_ups += 1
+            self.bytes -= entry.size
+            entry.apply(changes)
+            self.bytes += entry.size
+        entry.version = cursor
+
+    def response_body(self, entry):
+        before = entry.size
+        body = entry.json()
+        self.bytes += entry.size - before
+        self._evict()
+        return body
+
+    async def snapshot_body(self, user_id, entry, fp_rate, with_words):
+        """The entry's membership snapshot payload, building the filter the first time this rate is asked for."""
+        if fp_rate not in entry.snapshots:
+            # Hashing tens of thousands of words takes a while, so it runs off the event loop, on a copy
+            words = frozenset(entry.words)
+            snapshot = await asyncio.to_thread(Snapshot, words, fp_rate)
+            if entry.words != words: # caught up meanwhile
+                snapshot.apply(entry.words - words, words - entry.words, entry.words)
+        before = entry.size
+        if fp_rate not in entry.snapshots: # nobody else built it while we waited
+            entry.add_snapshot(fp_rate, snapshot)
+        body = entry.snapshot_payload(fp_rate, with_words)
+        if self._entries.get(user_id) is entry:
+            self.bytes += entry.size - before
+            self._evict()
+        return body
+
+    def _store(self, user_id, entry):
+        self._drop(user_id)
+        self._entries[user_id] = entry
+        self.bytes += entry.size
+        self._evict()
+
+    def _drop(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self.bytes -= entry.size
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "catch_ups": self.catch_ups,
+            "evictions": self.evictions,
+        }
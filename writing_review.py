@@ -0,0 +1,98 @@
+"""
+Multi-aspect review of a student's writing.
+
+Instead of one prompt asking for every kind of feedback about the whole text, each aspect (grammar, cultural
+appropriateness, naturalness) is reviewed separately, and long texts are split into chunks of whole paragraphs.
+Every (aspect, chunk) pair is an independent, streamed LLM call run on a thread pool, so a long submission takes
+about as long as its slowest chunk rather than the sum, and every part shows text from its first token on.
+Results are yielded as they arrive and merged back in text order.
+"""
+import contextvars
+import math
+import queue
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+# (prompt name in llm.PROMPTS, heading shown above its feedback), in report order
+ASPECTS = [
+    ("writing_grammar", "Grammar"),
+    ("writing_culture", "Cultural appropriateness"),
+    ("writing_naturalness", "Naturalness"),
+]
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?。])\s+")
+
+def split_into_chunks(text, max_chars=None, max_chunks=None):
+    """
+    Split text into chunks of whole paragraphs of up to about max_chars each. Paragraphs longer than that are
+    split between sentences. Chunks grow past max_chars when needed to stay within max_chunks.
+    """
+    text = text.strip()
+    max_chars = max_chars or config.WRITING_CHUNK_CHARS
+    max_chunks = max_chunks or config.WRITING_MAX_CHUNKS
+    max_chars = max(max_chars, math.ceil(len(text) / max_chunks))
+
+    pieces = [] # (text, separator used when it joins the previous piece in a chunk)
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        paragraph = paragraph.strip()
+        if len(paragraph) <= max_chars:
+            pieces.append((paragraph, "\n\n"))
+        else:
+            sentences = _SENTENCE_END.split(paragraph)
+            pieces.append((sentences[0], "\n\n"))
+            pieces.extend((sentence, " ") for sentence in sentences[1:])
+
+    chunks = []
+    for piece, separator in pieces:
+        if not piece:
+            continue
+        if chunks and len(chunks[-1]) + len(separator) + len(piece) <= max_chars:
+            chunks[-1] += separator + piece
+        else:
+            chunks.append(piece)
+    return chunks or [text]
+
+def _intro(index, count):
+    if count == 1:
+        return "This is the student's writing:"
+    return f"This is part {index + 1} of {count} of the student's writing:"
+
+class WritingReviewer:
+    def __init__(self, gateway, workers=None):
+        self.gateway = gateway
+        self._executor = ThreadPoolExecutor(max_workers=workers or config.WRITING_REVIEW_WORKERS, thread_name_prefix="writing-review")
+
+    def review(self, chunks):
+        """
+        Review every chunk for every aspect concurrently, streaming each part. Yields (aspect index, chunk index,
+        text so far, done, error) whenever a part gets more text, finishes or fails, in arrival order. error is
+        only set on a part's last event, with whatever text arrived before it.
+        """
+        events = queue.Queue()
+        parts = 0
+        for aspect_index, (prompt, _) in enumerate(ASPECTS):
+            for chunk_index, chunk in enumerate(chunks):
+                inputs = {"intro": _intro(chunk_index, len(chunks)), "writing": chunk}
+                # Run in a copy of the caller's context so the calls count towards its rerun in the metrics
+                call = contextvars.copy_context().run
+                self._executor.submit(call, self._stream_part, (aspect_index, chunk_index), prompt, inputs, events)
+                parts += 1
+        while parts:
+            (aspect_index, chunk_index), text, done, error = events.get()
+            parts -= done
+            yield aspect_index, chunk_index, text, done, error
+
+    def _stream_part(self, key, prompt, inputs, events):
+        # Streamlit elements can only be drawn from the script thread, so the deltas go back through the queue
+        text = ""
+        try:
+            for delta in self.gateway.stream(prompt, inputs):
+                text += delta
+                events.put((key, text, False, None))
+        except Exception as e:
+            events.put((key, text, True, e))
+        else:
+            events.put((key, text, True, None))